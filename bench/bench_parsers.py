@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Compare HTML parser backends on captured CourseN@vi pages.
+
+Usage: python bench/bench_parsers.py dashboard.html course_detail.html ...
+"""
+import os
+import sys
+import timeit
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from api import PARSERS, FormState, soupify
+
+
+@click.command()
+@click.argument('pages', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False))
+@click.option('-n', '--number', default=10,
+              help='Parses per backend and page')
+def main(pages, number):
+    for page in pages:
+        with open(page, encoding='utf-8') as f:
+            html = f.read()
+
+        print(f'{os.path.basename(page)} ({len(html) / 1024:.0f} KiB)')
+        for parser in PARSERS:
+            for restrict in (False, True):
+                if parser == 'html5lib' and restrict:
+                    continue
+                parse = lambda: FormState.from_soup(soupify(html,
+                                                            parser,
+                                                            restrict))
+                seconds = timeit.timeit(parse, number=number) / number
+                label = parser + (' (restricted)' if restrict else '')
+                print(f'  {label:<26}{seconds * 1000:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
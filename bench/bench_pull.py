@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""End-to-end benchmark of `TaskManager.pull` against the local mock server.
+
+Every scenario crawls the same synthetic account from scratch and reports
+wall-clock time, request count and bytes transferred. Results can be saved
+and later compared against, failing when a scenario got slower than the
+tolerance allows.
+
+Usage: python bench/bench_pull.py --save baseline.json
+       python bench/bench_pull.py --compare baseline.json
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import click
+
+# Keep the session cache and downloads of benchmark runs out of ~
+os.environ['HOME'] = tempfile.mkdtemp(prefix='cnavi-bench-')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from mock_server import EMAIL, PASSWORD, MockCourseNavi
+from task_manager import TaskManager
+
+
+SCENARIOS = {
+    'baseline':        {},
+    'lxml-restricted': {'parser': 'lxml'},
+    'stream':          {'stream': True},
+    'jobs-4':          {'jobs': 4},
+    'lecture-jobs-4':  {'lecture_jobs': 4},
+    'jobs-4-lxml':     {'jobs': 4, 'lecture_jobs': 4, 'parser': 'lxml'},
+    'pipeline-4':      {'jobs': 4, 'lecture_jobs': 4, 'parse_workers': 4},
+}
+
+
+def run(server, options):
+    """Run one pull from scratch and return its measurements."""
+    server.stats.reset()
+    root = tempfile.mkdtemp(prefix='cnavi-bench-files-')
+    tm = TaskManager(root=root, fresh_login=True, base_url=server.base_url,
+                     email=EMAIL, password=PASSWORD, **options)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tm.pull()
+    seconds = time.perf_counter() - start
+    tm.close()
+
+    return dict(server.stats.snapshot(), seconds=seconds)
+
+
+@click.command()
+@click.option('--courses', default=8, help='Courses on the dashboard')
+@click.option('--lectures', default=10, help='Lectures per course')
+@click.option('--attachments', default=1, help='Attachments per lecture')
+@click.option('--latency', default=0.02,
+              help='Simulated network latency per response in s')
+@click.option('--repeat', default=3, help='Runs per scenario (best is kept)')
+@click.option('-s', '--scenario', 'names', multiple=True,
+              type=click.Choice(SCENARIOS), help='Scenarios to run')
+@click.option('--save', type=click.Path(dir_okay=False),
+              help='Save results as JSON')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False),
+              help='Fail if slower than saved results')
+@click.option('--tolerance', default=0.25,
+              help='Allowed slowdown against --compare, as a fraction')
+def main(courses, lectures, attachments, latency, repeat, names, save,
+         compare, tolerance):
+    server = MockCourseNavi(('127.0.0.1', 0), courses=courses,
+                            lectures=lectures, attachments=attachments,
+                            latency=latency).start()
+
+    results = {}
+    print(f'{"scenario":<18}{"seconds":>9}{"requests":>10}'
+          + f'{"KiB sent":>10}{"KiB recv":>10}')
+    for name in names or SCENARIOS:
+        runs = [run(server, SCENARIOS[name]) for _ in range(repeat)]
+        result = min(runs, key=lambda result: result['seconds'])
+        results[name] = result
+        print(f'{name:<18}{result["seconds"]:>9.2f}{result["requests"]:>10}'
+              + f'{result["bytes_sent"] / 1024:>10.0f}'
+              + f'{result["bytes_received"] / 1024:>10.0f}')
+
+    server.shutdown()
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        regressions = [
+            name for name, result in results.items()
+            if name in baseline
+            and result['seconds'] > baseline[name]['seconds'] * (1 + tolerance)
+        ]
+        for name in regressions:
+            print(f'Regression in {name}: {results[name]["seconds"]:.2f}s '
+                  + f'vs {baseline[name]["seconds"]:.2f}s')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
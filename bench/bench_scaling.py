@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Scaling microbenchmarks for the page-parsing paths.
+
+Dashboards and course details with 10, 100 and 1,000 rows are generated
+(see `pages.py`) and every stage that reads them is timed. The cost per row
+must stay flat as pages grow: the run fails if any stage's cost per row at
+the largest size exceeds `--max-growth` times its cost at the second
+largest, i.e. if it scales worse than linearly.
+
+Usage: python bench/bench_scaling.py
+       python bench/bench_scaling.py --parser lxml --profile
+"""
+import cProfile
+import os
+import pstats
+import sys
+import timeit
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from api import PARSERS, CourseNaviInterface
+import pages
+
+
+SIZES = (10, 100, 1000)
+
+
+def stages(api, rows):
+    """Return (name, callable) of every stage timed for a size."""
+    dashboard_html = pages.dashboard_page(rows, 'key')
+    course_detail_html = pages.course_detail_page(rows, 'key')
+    dashboard = api._soupify(dashboard_html)
+    course_detail = api._soupify(course_detail_html)
+
+    course_rows = dashboard.find_all(attrs={'class': 'w-conbox'})
+    dates = [row.find(attrs={'class': 'w-col4'}).text for row in course_rows]
+    ad_hoc_fields = [row.find(attrs={'class': 'w-col1'})
+                     for row in course_rows[:-1]]
+    lecture_rows = course_detail.find_all(attrs={'class': 'c-mblock'})[1:]
+    post_submits = [row.find(attrs={'class': 'c-read'})
+                    for row in lecture_rows]
+
+    return [
+        ('_soupify(dashboard)', lambda: api._soupify(dashboard_html)),
+        ('_soupify(course_detail)', lambda: api._soupify(course_detail_html)),
+        ('get_courses', lambda: api.get_courses(dashboard)),
+        ('get_lectures', lambda: api.get_lectures(course_detail)),
+        ('_is_valid_date', lambda: [api._is_valid_date(date)
+                                    for date in dates]),
+        ('_parse_post_submit_edit',
+         lambda: [api._parse_post_submit_edit(fields)
+                  for fields in ad_hoc_fields]),
+        ('_parse_post_submit',
+         lambda: [api._parse_post_submit(fields) for fields in post_submits]),
+    ]
+
+
+def measure(func):
+    """Return the best time of a single call of func in seconds."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    return min([elapsed] + timer.repeat(repeat=2, number=number)) / number
+
+
+@click.command()
+@click.option('-p', '--parser', type=click.Choice(PARSERS),
+              default='html5lib')
+@click.option('--restrict', is_flag=True, help='Use restricted parsing')
+@click.option('--max-growth', default=1.5,
+              help='Allowed growth of the cost per row between the two '
+                   + 'largest sizes')
+@click.option('--profile', is_flag=True,
+              help='Profile every stage at the largest size')
+def main(parser, restrict, max_growth, profile):
+    api = CourseNaviInterface(parser=parser, restrict=restrict,
+                              email='-', password='-')
+
+    per_row = {}
+    print(f'{"stage":<26}' + ''.join(f'{f"µs/row @{size}":>16}'
+                                      for size in SIZES))
+    results = {size: {name: measure(func) / size
+                      for name, func in stages(api, size)}
+               for size in SIZES}
+    for name in results[SIZES[0]]:
+        per_row[name] = [results[size][name] for size in SIZES]
+        print(f'{name:<26}' + ''.join(f'{cost * 1e6:>16.2f}'
+                                      for cost in per_row[name]))
+
+    if profile:
+        for name, func in stages(api, SIZES[-1]):
+            print(f'\n--- {name} @{SIZES[-1]} rows')
+            profiler = cProfile.Profile()
+            profiler.runcall(func)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(8)
+
+    regressions = [name for name, costs in per_row.items()
+                   if costs[-1] > costs[-2] * max_growth]
+    for name in regressions:
+        print(f'{name} scales worse than linearly: '
+              + f'{per_row[name][-1] / per_row[name][-2]:.2f}x cost per row '
+              + f'from {SIZES[-2]} to {SIZES[-1]} rows')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
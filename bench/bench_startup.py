@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Startup budget of the `cnavi` CLI.
+
+Runs quick commands in fresh interpreters with `python -X importtime` and
+fails if importing the CLI takes longer than `--budget`, or if any of them
+loads a module of the parser and network stack (`HEAVY_MODULES`), which
+only the commands that talk to CourseN@vi may import.
+
+Usage: python bench/bench_startup.py
+       python bench/bench_startup.py --budget 50 --top 15
+"""
+import os
+import re
+import subprocess
+import sys
+
+import click
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Commands that must start without the parser and network stack
+QUICK_COMMANDS = (
+    ['--help'],
+    ['pull', '--help'],
+    ['config', '--help'],
+    ['serve', '--help'],
+    ['ls', '--help'],
+    ['search', '--help'],
+)
+
+HEAVY_MODULES = ('bs4', 'html5lib', 'lxml', 'requests', 'requests_toolbelt',
+                 'keyring', 'aiohttp', 'api', 'task_manager')
+
+# `import time: self [us] | cumulative | imported package`
+IMPORT_LINE = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \| (\s*)(\S+)')
+
+
+def import_times(args):
+    """Run the CLI with args and return every import of the run.
+
+    Return a list of (module, cumulative µs, depth) in import order.
+    """
+    # Import the CLI as a module, as the `cnavi` entry point does
+    code = ('import sys; '
+            + f'sys.argv = ["cnavi"] + {args!r}; '
+            + 'import cli; cli.main()')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=SRC, capture_output=True, text=True,
+                            check=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            _, cumulative, indent, module = match.groups()
+            imports.append((module, int(cumulative), len(indent) // 2))
+    return imports
+
+
+def cli_imports(imports):
+    """Return the imports made by importing the CLI, ending with the CLI
+    itself, leaving out those of interpreter startup (`site` and its `.pth`
+    files) and of running the command.
+    """
+    end = next(index for index, (module, _, _) in enumerate(imports)
+               if module == 'cli')
+    # The CLI's own imports are listed right before it, indented
+    start = end
+    while start > 0 and imports[start - 1][2] > 0:
+        start -= 1
+    return imports[start:end + 1]
+
+
+@click.command()
+@click.option('--budget', default=60.0,
+              help='Allowed time to import the CLI in ms')
+@click.option('--repeat', default=5, help='Runs per command (best is kept)')
+@click.option('--top', default=10,
+              help='Number of slowest imports to list per command')
+def main(budget, repeat, top):
+    failed = False
+    for args in QUICK_COMMANDS:
+        runs = [import_times(args) for _ in range(repeat)]
+        imports = min(runs, key=lambda imports: cli_imports(imports)[-1][1])
+        cli_ms = cli_imports(imports)[-1][1] / 1000
+
+        command = ' '.join(['cnavi'] + args)
+        print(f'{command:<24}{cli_ms:>8.1f} ms to import cli')
+        slowest = sorted(((cumulative, module)
+                          for module, cumulative, depth in cli_imports(imports)
+                          if depth == 1),
+                         reverse=True)[:top]
+        for cumulative, module in slowest:
+            print(f'    {module:<28}{cumulative / 1000:>8.1f} ms')
+
+        heavy = sorted({module for module, _, _ in imports
+                        if module.split('.')[0] in HEAVY_MODULES})
+        if heavy:
+            failed = True
+            print(f'{command} imports {", ".join(heavy)}')
+        if cli_ms > budget:
+            failed = True
+            print(f'{command} is over the budget of {budget:.0f} ms')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
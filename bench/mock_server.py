@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""Local stand-in for CourseN@vi.
+
+Serves synthetic login, dashboard, course detail and lecture detail pages
+(see `pages.py`) and validates posted hidden fields the way the real server
+does: every POST must echo the session's `SessionIdEncodeKey` and carry the
+fields of its navigation step, and a course must be opened before its
+lectures. A request from an unknown or expired session gets the login page,
+a request missing fields gets a 500.
+
+Usage: python bench/mock_server.py --port 8000 --courses 20 --lectures 15
+"""
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import secrets
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+import zlib
+
+import click
+
+import pages
+
+
+EMAIL = 'student@example.com'
+PASSWORD = 'password'
+COOKIE = 'MOCKSESSID'
+
+# Fields each navigation step must post, keyed on ControllerParameters
+REQUIRED_FIELDS = {
+    'login': ['id', 'password', 'ControllerParameters2', 'hidLogin_flg'],
+    'login_redirect': ['hidCommunityId', 'hidListMode', 'hidLogin_flg'],
+    'dashboard': ['hidCommunityId', 'hidListMode'],
+    'course_detail': ['hidCommunityId', 'hidFolderId', 'hidNewWindowFlg',
+                      'folder_id[]', 'community_name[]', 'communityIdInfo[]'],
+    'course_redirect': ['hidCommunityId', 'hidListMode', 'folder_id[]',
+                        'community_name[]', 'communityIdInfo[]'],
+    'lecture_detail': ['hidAdmKey02', 'hidAdmKey07', 'hidListMode',
+                       'hidCommunityId', 'hidLectureFlg'],
+}
+
+
+class Stats:
+    """Counters of the traffic served."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.steps = {}
+
+    def record(self, step, received, sent):
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+            self.steps[step] = self.steps.get(step, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'steps': dict(self.steps),
+            }
+
+
+class MockCourseNavi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, courses=10, lectures=10, attachments=2,
+                 attachment_size=64 * 1024, latency=0.0, timeout=60):
+        """address         -- (host, port) to listen on
+        courses         -- number of courses on the dashboard
+        lectures        -- number of lectures per course
+        attachments     -- number of attachments per lecture
+        attachment_size -- size of each attachment in bytes
+        latency         -- seconds every response is delayed by
+        timeout         -- session timeout in minutes
+        """
+        super().__init__(address, Handler)
+        self.courses = courses
+        self.lectures = lectures
+        self.attachments = attachments
+        self.attachment_size = attachment_size
+        self.latency = latency
+        self.timeout = timeout
+        self.stats = Stats()
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/index.php'
+
+    def start(self):
+        """Serve from a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def new_session(self):
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            self.sessions[session_id] = {
+                'key': secrets.token_hex(8),
+                'logged_in': False,
+                'community': None,
+                'opened': None,
+                'used_at': time.time(),
+            }
+        return session_id
+
+    def session(self, session_id):
+        """Return the live session with an id, or None."""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            if session['used_at'] + self.timeout * 60 < time.time():
+                del self.sessions[session_id]
+                return None
+            session['used_at'] = time.time()
+            return session
+
+    def expire_sessions(self):
+        """Expire every session, as if they had timed out."""
+        with self._lock:
+            self.sessions.clear()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        received = self._request_size(0)
+        path = unquote(urlparse(self.path).path)
+        if path.startswith('/files/'):
+            return self._send_attachment(path, received)
+
+        session_id = self._session_id()
+        session = self.server.session(session_id)
+        if session is None:
+            session_id = self.server.new_session()
+            session = self.server.session(session_id)
+        self._send_html('login_page', pages.login_page(session['key']),
+                        received, session_id)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        received = self._request_size(length)
+        fields = self._parse_fields(body)
+
+        session_id = self._session_id()
+        session = self.server.session(session_id)
+        if session is None or fields.get('SessionIdEncodeKey') != session['key']:
+            key = session['key'] if session else ''
+            return self._send_html('expired', pages.login_page(key), received)
+
+        step = fields.get('ControllerParameters')
+        missing = [field for field in REQUIRED_FIELDS.get(step, [])
+                   if field not in fields]
+        if step not in REQUIRED_FIELDS or missing:
+            return self._send_error(step, received, 500)
+
+        if step != 'login' and not session['logged_in']:
+            return self._send_html(step, pages.login_page(session['key']),
+                                   received)
+
+        key = session['key']
+        if step == 'login':
+            if fields['id'] != EMAIL or fields['password'] != PASSWORD:
+                html = pages.login_page(key)
+            else:
+                session['logged_in'] = True
+                html = pages.redirect_page('login_redirect', key)
+        elif step in ('login_redirect', 'dashboard'):
+            html = pages.dashboard_page(self.server.courses, key)
+        elif step == 'course_detail':
+            session['community'] = fields['hidCommunityId']
+            html = pages.redirect_page('course_redirect', key)
+        elif step == 'course_redirect':
+            if fields['communityIdInfo[]'] != session['community']:
+                return self._send_error(step, received, 500)
+            session['opened'] = session['community']
+            html = pages.course_detail_page(self.server.lectures, key)
+        else:
+            if session['opened'] is None:
+                return self._send_error(step, received, 500)
+            lecture = pages.lecture_title(int(fields['hidAdmKey02'][1:]))
+            html = pages.lecture_detail_page(session['opened'], lecture,
+                                             self.server.attachments, key)
+
+        self._send_html(step, html, received)
+
+    def _send_attachment(self, path, received):
+        _, _, community, lecture, name = path.split('/', 4)
+        content = pages.attachment(community, lecture, name,
+                                   self.server.attachment_size)
+        etag = f'"{zlib.crc32(content):08x}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            return self._send('attachment', 304, b'', received,
+                              {'ETag': etag})
+
+        headers = {'ETag': etag, 'Content-Type': 'application/pdf'}
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', etag) == etag:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(content):
+                return self._send('attachment', 416, b'', received, headers)
+            headers['Content-Range'] = \
+                f'bytes {start}-{len(content) - 1}/{len(content)}'
+            content = content[start:]
+            status = 206
+
+        self._send('attachment', status, content, received, headers)
+
+    def _send_html(self, step, html, received, session_id=None):
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        if session_id is not None:
+            headers['Set-Cookie'] = f'{COOKIE}={session_id}; Path=/'
+        self._send(step, 200, html.encode('utf-8'), received, headers)
+
+    def _send_error(self, step, received, status):
+        self._send(step, status, b'Internal Server Error', received,
+                   {'Content-Type': 'text/plain'})
+
+    def _send(self, step, status, content, received, headers):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.stats.record(step, received, len(content))
+
+    def _session_id(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return cookie[COOKIE].value if COOKIE in cookie else None
+
+    def _request_size(self, body_length):
+        return len(self.requestline) + len(str(self.headers)) + body_length
+
+    def _parse_fields(self, body):
+        """Return the posted form fields, urlencoded or multipart."""
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1')
+                + body)
+            return {part.get_param('name', header='content-disposition'):
+                    part.get_content()
+                    for part in message.iter_parts()}
+
+        fields = parse_qs(body.decode('utf-8'), keep_blank_values=True)
+        return {name: values[0] for name, values in fields.items()}
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8000)
+@click.option('--courses', default=10, help='Courses on the dashboard')
+@click.option('--lectures', default=10, help='Lectures per course')
+@click.option('--attachments', default=2, help='Attachments per lecture')
+@click.option('--latency', default=0.0, help='Delay of every response in s')
+def main(host, port, courses, lectures, attachments, latency):
+    server = MockCourseNavi((host, port), courses=courses, lectures=lectures,
+                            attachments=attachments, latency=latency)
+    print(f'Serving {server.base_url} (login: {EMAIL} / {PASSWORD})')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Synthetic CourseN@vi pages.
+
+The markup mirrors what `CourseNaviInterface` reads on the real site: hidden
+inputs on every page, `w-conbox` course rows on the dashboard and `c-mblock`
+lecture rows on a course detail page.
+"""
+from html import escape
+
+
+# Hidden inputs of the login form
+LOGIN_FIELDS = [
+    'lang', 'ControllerParameters', 'ControllerParameters2', 'hidSessionKey',
+    'hidSessionKeyFlg', 'hidPankuzuSessionKey', 'SessionIdEncodeKey',
+    'hidLogin_flg', 'hidInquiry', 'hidNameFlg', 'hidAdmission',
+    'hidAdmKey01', 'hidAdmKey02', 'hidAdmKey03', 'hidAdmKey04',
+    'hidAdmKey05', 'hidAdmKey06', 'hidAdmKey07', 'hidAdmKey08',
+    'hidAdmKey90', 'hidAdmKey91',
+]
+
+# Hidden inputs of every page once logged in
+GENERAL_FIELDS = LOGIN_FIELDS + [
+    'hidCommunityId', 'hidCommKcd', 'hidCommBcd', 'hidFolderId',
+    'hidContentsId', 'hidListMode', 'hidEditButton', 'hidInputFuncType',
+    'hidsocial_no', 'hidDesignInfo', 'simpletype', 'hidCurrentViewID',
+    'hidCloseFlg', 'hidSessionDelFlg', 'hidContactFunTypeCd',
+    'hidContactFolderId', 'hidContactCommunityId', 'hidContactContentsId',
+    'hidKamokuId', 'hidSessionTimeOut', 'hidWarningForSessionTimeOut',
+    'hidWarningForSessionTimeOutDispLogin', 'xpoint', 'ypoint', 'tagname',
+    'hidLanguage', 'hidState', 'hidCommounity', 'hidDesignFlg',
+    'hidCurrentStudyFlg', 'hidCurrentFolderId', 'hidNewListFlg',
+    'hidMenuFlg', 'hidNewWindowFlg', 'hidCheckSelectFlg', 'hidSwfFileName',
+    'hidFlg', 'hidUsers', 'hidListCnt', 'hidLogoutFlg', 'hidLoginID',
+    'hidTabId', 'hidMenuId', 'hidDesignId', 'hidURL', 'hidZX21PageNo',
+    'hidInputMode', 'hidSelectList', 'hidFileId', 'hidCommentDisp',
+    'hidPankuzuFlg', 'hidZX22PageNo', 'hidAddation_back',
+    'hidAnimationSign', 'hidJudgeFlg', 'HID_P3', 'HID_P14', 'HID_P41',
+    'HID_P42', 'HID_P43', 'HID_P44', 'HID_P45', 'hidListToHistory',
+    'hidScrollTop', 'hidDisplayNone',
+]
+
+# Repeated on every page to give pages a realistic size
+FILLER = ('<div class="l-side"><ul>'
+          + '<li><span>お知らせ</span><span>Information</span></li>' * 20
+          + '</ul></div>')
+
+
+def course_id(index):
+    return f'comm{index:05d}'
+
+
+def course_title(index):
+    return f'Course {index:05d}'
+
+
+def lecture_title(index):
+    return f'Lecture {index:04d}'
+
+
+def attachment_name(index):
+    return f'handout-{index:02d}.pdf'
+
+
+def page(fields, controller, key, body='', timeout=60):
+    """Return a full page.
+
+    fields     -- names of the hidden inputs to include
+    controller -- value of ControllerParameters, i.e. the next action
+    key        -- value of SessionIdEncodeKey
+    body       -- HTML of the page content
+    timeout    -- value of hidSessionTimeOut in minutes
+    """
+    values = {
+        'ControllerParameters': controller,
+        'SessionIdEncodeKey': key,
+        'hidSessionTimeOut': str(timeout),
+        'hidWarningForSessionTimeOut': str(max(timeout - 5, 0)),
+    }
+    inputs = ''.join(
+        f'<input type="hidden" name="{name}" '
+        + f'value="{escape(values.get(name, name.lower()))}">'
+        for name in fields)
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+            + '<title>Course N@vi</title></head><body>'
+            + f'<form name="MainForm" method="post">{inputs}{FILLER}'
+            + f'<div class="l-main">{body}</div></form></body></html>')
+
+
+def login_page(key):
+    body = ('<input type="text" name="id">'
+            + '<input type="password" name="password">')
+    return page(LOGIN_FIELDS, 'login', key, body)
+
+
+def redirect_page(controller, key):
+    """Intermediate page that the browser auto-submits."""
+    return page(GENERAL_FIELDS, controller, key)
+
+
+def course_row(index):
+    community = course_id(index)
+    return (
+        '<div class="w-conbox">'
+        + '<p class="w-col4">月3</p>'
+        + '<p class="w-col6">'
+        + f'<input type="hidden" name="folder_id[]" value="f{community}">'
+        + f'<input type="hidden" name="community_name[]" '
+        + f'value="{course_title(index)}">'
+        + '<input type="hidden" name="hdnIcon[]" value="0">'
+        + f'<input type="hidden" name="communityIdInfo[]" value="{community}">'
+        + f'<input type="hidden" name="sequenceInfo[]" value="{index}">'
+        + '</p>'
+        + '<p class="w-col1"><span>[講義]</span>'
+        + '<a href="#" onclick="post_submit_edit('
+        + f"'course_detail', 'f{community}', '', 'list', '{community}'"
+        + f'); return false;">{course_title(index)}</a></p>'
+        + '</div>')
+
+
+def dashboard_page(courses, key):
+    """Dashboard listing a number of courses, plus one non-course row."""
+    rows = [course_row(index) for index in range(courses)]
+    rows.append('<div class="w-conbox"><p class="w-col4">Other</p>'
+                + '<p class="w-col1"><a href="#">Community</a></p></div>')
+    return page(GENERAL_FIELDS, 'dashboard', key, ''.join(rows))
+
+
+def lecture_row(index):
+    return (
+        '<div class="c-mblock">'
+        + f'<p class="ta1col-left" title="{lecture_title(index)}">'
+        + f'{lecture_title(index)}</p>'
+        + '<p class="c-date">2019/10/01</p>'
+        + '<span class="c-read"><a href="#" onclick="post_submit('
+        + f"'lecture_detail', 'l{index:04d}', 'c', 'detail', '0', '', '', "
+        + "'1', '', '0'"
+        + ');">詳細</a></span>'
+        + '</div>')
+
+
+def course_detail_page(lectures, key):
+    """Course detail listing a number of lectures, plus a notice row."""
+    rows = ['<div class="c-mblock"><p class="ta1col-left" title="お知らせ">'
+            + 'お知らせ</p></div>']
+    rows.extend(lecture_row(index) for index in range(lectures))
+    return page(GENERAL_FIELDS, 'course_detail', key, ''.join(rows))
+
+
+def lecture_detail_page(community, lecture, attachments, key):
+    links = ''.join(
+        f'<li><a href="files/{community}/{lecture}/{attachment_name(index)}">'
+        + f'{attachment_name(index)}</a></li>'
+        for index in range(attachments))
+    body = f'<h2>{escape(lecture)}</h2><ul class="c-file">{links}</ul>'
+    return page(GENERAL_FIELDS, 'lecture_detail', key, body)
+
+
+def attachment(community, lecture, name, size):
+    """Deterministic attachment contents."""
+    seed = f'{community}/{lecture}/{name}\n'.encode('utf-8')
+    return (seed * (size // len(seed) + 1))[:size]
@@ -1,29 +1,607 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import copy
+import hashlib
+import json
 import os
 import re
+import threading
+import time
+from types import MappingProxyType
+from urllib.parse import unquote, urljoin, urlparse
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import keyring
 import requests
 from requests_toolbelt import MultipartEncoder
 
+from extractor import extract_stream
+from settings import BASE_URL, PARSERS
+
+# Days that a course's date starts with
+DAY_PREFIXES = ('月', '火', '水', '木', '金', '土',
+                'Mon', 'Tues', 'Wed', 'Thur', 'Fri', 'Sat')
+
+# Quoted arguments of an onclick function like `post_submit('foo', '')`
+QUOTED_ARGUMENT = re.compile("(?<=')([^',]*)(?=')")
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Links to files with these extensions are treated as attachments
+ATTACHMENT_EXTENSIONS = (
+    '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx', '.txt',
+    '.csv', '.zip', '.jpg', '.jpeg', '.png', '.mp3', '.mp4', '.m4a', '.wmv',
+)
+
+# Steps that are only answered within a logged-in session. An expired
+# session answers them with the login page instead.
+SESSION_STEPS = frozenset([
+    'course_detail',
+    'course_detail_redirect',
+    'lecture_detail',
+])
+
+# Steps served from the response cache. Every other step logs in or changes
+# which course the server has open, so it must reach the server; replaying
+# it would leave the server in another state than the client believes, and
+# carry an old session's SessionIdEncodeKey. This includes every step of
+# `_relogin()`.
+CACHED_STEPS = frozenset([
+    'lecture_detail',
+])
+
+# Times a step is retried after logging in again because the session expired
+RELOGIN_ATTEMPTS = 2
+
+# Seconds to wait for the server while downloading an attachment, when no
+# Throttle sets a timeout
+ATTACHMENT_TIMEOUT = 60
+
+# The password input of the login page, found without parsing the page
+LOGIN_FORM = re.compile(r'<input[^>]*type=["\']?password', re.IGNORECASE)
+
+# Present on every CourseN@vi page; a parse missing them is considered broken
+REQUIRED_FIELDS = ('ControllerParameters', 'SessionIdEncodeKey')
+
+# Hidden fields of a course row that are posted to open the course
+COURSE_FIELDS = (
+    'folder_id[]',
+    'community_name[]',
+    'hdnIcon[]',
+    'communityIdInfo[]',
+    'sequenceInfo[]',
+)
+
+
+class FormState:
+    """Snapshot of every named element on a page and its value.
+
+    The page is walked once on construction, so looking up any number of
+    fields afterwards costs a dictionary access instead of a tree traversal.
+    Like `soup.find()`, the first element with a given name wins.
+    """
+
+    def __init__(self, fields):
+        """fields -- dict mapping each name to its value (None if the
+                     element had no value attribute)
+        """
+        self.fields = fields
+
+    @classmethod
+    def from_soup(cls, html):
+        """Index every named element of a soupified page in a single pass.
+
+        html -- Soupified HTML
+        """
+        fields = {}
+        for element in html.find_all(attrs={'name': True}):
+            fields.setdefault(element['name'], element.get('value'))
+        return cls(fields)
+
+    @classmethod
+    def of(cls, page):
+        """Return the FormState of a page returned by an interface.
+
+        page -- Soupified HTML or, with a parse pool, a Page
+        """
+        if isinstance(page, Page):
+            return page.form
+        return cls.from_soup(page)
+
+    def value(self, name):
+        """Return the value of the element with a given name.
+
+        name -- queried name
+        """
+        try:
+            value = self.fields[name]
+        except KeyError:
+            raise NoElementError(f'No element found for "name={name}"')
+        if value is None:
+            raise NoElementError(f'No value for element with "name={name}"')
+        return value
+
+    def session_timeout(self):
+        """Return the session timeout announced by the page in seconds, or
+        None if the page does not announce one.
+
+        `hidSessionTimeOut` is given in minutes.
+        """
+        try:
+            return int(self.value('hidSessionTimeOut')) * 60
+        except (NoElementError, ValueError):
+            return None
+
+    def is_logged_in(self):
+        """Return True if the page belongs to a logged-in session.
+
+        Anything but the login form carries `REQUIRED_FIELDS` and no
+        password field.
+        """
+        return ('password' not in self.fields
+                and all(field in self for field in REQUIRED_FIELDS))
+
+    def __contains__(self, name):
+        return self.fields.get(name) is not None
+
+
+class Course:
+    """A course listed on the dashboard.
+
+    Holds only what selecting the course needs, so that the dashboard's soup
+    can be freed as soon as its courses are extracted.
+    """
+    __slots__ = ('title', 'fields', 'ad_hoc_fields')
+
+    def __init__(self, title, fields, ad_hoc_fields):
+        """title         -- title of the course
+        fields        -- dict of the course row's hidden fields (see
+                         `COURSE_FIELDS`)
+        ad_hoc_fields -- dict of the arguments of its `post_submit_edit()`
+                         (see `CourseNaviInterface._parse_post_submit_edit()`)
+        """
+        self.title = title
+        self.fields = fields
+        self.ad_hoc_fields = ad_hoc_fields
+
+    def __repr__(self):
+        return f'Course({self.title!r})'
+
+
+class Lecture:
+    """A lecture listed on a course detail.
+
+    Holds only what selecting the lecture needs, so that the course detail's
+    soup can be freed as soon as its lectures are extracted.
+    """
+    __slots__ = ('title', 'ad_hoc_fields', 'fingerprint')
+
+    def __init__(self, title, ad_hoc_fields, fingerprint=None):
+        """title         -- title of the lecture
+        ad_hoc_fields -- dict of the arguments of its `post_submit()` (see
+                         `CourseNaviInterface._parse_post_submit()`)
+        fingerprint   -- hash of everything the lecture row shows, which
+                         changes whenever the lecture does
+        """
+        self.title = title
+        self.ad_hoc_fields = ad_hoc_fields
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f'Lecture({self.title!r})'
+
+
+class Page:
+    """Everything read from a page, extracted in a parse pool.
+
+    Interfaces with a parse pool return Pages instead of soupified HTML, so
+    that soups never leave the process that built them. `FormState.of()`,
+    `get_courses()`, `get_lectures()` and `get_attachments()` accept both.
+    Course details are always returned as Pages (see
+    `CourseNaviInterface.select_course()`).
+    """
+    __slots__ = ('form', 'courses', 'lectures', 'attachments', 'text')
+
+    def __init__(self, form, courses=(), lectures=(), attachments=(),
+                 text=''):
+        """form        -- FormState of the page
+        courses     -- Courses listed on the page
+        lectures    -- Lectures listed on the page
+        attachments -- tuples of attachments' file names and URLs
+        text        -- visible text of the page (see `_page_text()`)
+        """
+        self.form = form
+        self.courses = courses
+        self.lectures = lectures
+        self.attachments = attachments
+        self.text = text
+
+
+class RelevantTagStrainer(SoupStrainer):
+    """Only build the parts of a page that are actually read.
+
+    Keeps <input> elements, links, course rows (`w-conbox`), lecture rows
+    (`c-mblock`) and anything with an onclick handler, along with their
+    descendants. Everything else is dropped while parsing.
+    """
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # bs4 >= 4.13
+        return self._is_relevant(name, attrs or {})
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # bs4 < 4.13
+        return self._is_relevant(markup_name, markup_attrs)
+
+    def _is_relevant(self, name, attrs):
+        if name == 'input' or 'onclick' in attrs:
+            return True
+        if name == 'a' and 'href' in attrs:
+            return True
+        classes = attrs.get('class') or ()
+        if isinstance(classes, str):
+            classes = classes.split()
+        return 'w-conbox' in classes or 'c-mblock' in classes
+
+
+class RequestTemplate:
+    """Declarative POST of a navigation step.
+
+    Which fields a step posts and how they are encoded never change, so
+    both are fixed once per step in the templates below. Templates are never
+    modified and are shared by every interface and thread; each request gets
+    its own params, headers and body.
+    """
+
+    def __init__(self, step, content_type, fields, defaults=None,
+                 form_only=False):
+        """step         -- navigation step name
+        content_type -- 'url-encoded' or 'multipart-form'
+        fields       -- names of the fields copied from the page's FormState
+        defaults     -- dict of constant fields, posted first
+        form_only    -- only the FormState of the response is read
+        """
+        if content_type not in ('url-encoded', 'multipart-form'):
+            raise InvalidContentTypeError(f'Invalid keyword: {content_type}')
+
+        self.step = step
+        self.multipart = content_type == 'multipart-form'
+        self.fields = tuple(fields)
+        self.defaults = MappingProxyType(dict(defaults or {}))
+        self.form_only = form_only
+
+    def params(self, form, values=None):
+        """Return the fields to POST.
+
+        form   -- FormState of the page the step is taken from
+        values -- dict of further fields, overriding those read from form
+        """
+        params = dict(self.defaults)
+        for field in self.fields:
+            params[field] = form.value(field)
+        if values:
+            params.update(values)
+        return params
+
+    def encode(self, params, headers):
+        """Return the headers and body of a request posting params.
+
+        A multipart body is consumed by sending it, so every request must
+        encode its own.
+
+        params  -- fields to POST
+        headers -- headers of the interface, whose Content-Type is
+                   url-encoded
+        """
+        if not self.multipart:
+            return headers, params
+        multipart = MultipartEncoder(fields=params)
+        headers = dict(headers, **{'Content-Type': multipart.content_type})
+        return headers, multipart
+
+
+# ---- Request templates of each navigation step ----
+
+LOGIN = RequestTemplate(
+    'login',
+    'url-encoded',
+    fields=(
+        'lang',
+        'ControllerParameters',
+        'ControllerParameters2',
+        'hidSessionKey',
+        'hidSessionKeyFlg',
+        'hidPankuzuSessionKey',
+        'SessionIdEncodeKey',
+        'hidLogin_flg',
+        'hidInquiry',
+        'hidNameFlg',
+        'hidAdmission',
+        'hidAdmKey01',
+        'hidAdmKey02',
+        'hidAdmKey03',
+        'hidAdmKey04',
+        'hidAdmKey05',
+        'hidAdmKey06',
+        'hidAdmKey07',
+        'hidAdmKey08',
+        'hidAdmKey90',
+        'hidAdmKey91',
+    ),
+    defaults={
+        'vertype': 1,
+        'simpletype': 0,
+    },
+    form_only=True)
+
+LOGIN_REDIRECT = RequestTemplate(
+    'login_redirect',
+    'url-encoded',
+    fields=(
+        'ControllerParameters',
+        'hidCommunityId',
+        'hidCommKcd',
+        'hidCommBcd',
+        'hidFolderId',
+        'hidContentsId',
+        'hidListMode',
+        'hidEditButton',
+        'hidInputFuncType',
+        'hidsocial_no',
+        'hidDesignInfo',
+        'simpletype',
+        'SessionIdEncodeKey',
+        'hidLogin_flg',
+        'hidAdmission',
+    ))
+
+# Resuming a saved session re-posts the redirect after login
+RESUME_SESSION = RequestTemplate(
+    'resume_session',
+    'url-encoded',
+    fields=LOGIN_REDIRECT.fields)
+
+COURSE_DETAIL = RequestTemplate(
+    'course_detail',
+    'multipart-form',
+    fields=(
+        'hidCurrentViewID',
+        'hidCloseFlg',
+        'hidSessionDelFlg',
+        'hidContactFunTypeCd',
+        'hidContactFolderId',
+        'hidContactCommunityId',
+        'hidContactContentsId',
+        'hidKamokuId',
+        'hidSessionTimeOut',
+        'hidWarningForSessionTimeOut',
+        'hidWarningForSessionTimeOutDispLogin',
+        'xpoint',
+        'ypoint',
+        'tagname',
+        'SessionIdEncodeKey',
+        'hidAdmission',
+        'hidAdmKey01',
+        'hidAdmKey02',
+        'hidAdmKey03',
+        'hidAdmKey04',
+        'hidAdmKey05',
+        'hidAdmKey06',
+        'hidAdmKey07',
+        'hidAdmKey08',
+        'hidAdmKey90',
+        'hidAdmKey91',
+        'hidLanguage',
+        'hidState',
+        'hidCommounity',
+        'hidDesignFlg',
+        'hidCurrentStudyFlg',
+        'simpletype',
+        'hidListMode',
+        'hidFolderId',
+        'hidContentsId',
+        'hidCurrentFolderId',
+        'hidNewListFlg',
+        'hidMenuFlg',
+        'hidEditButton',
+        'hidNewWindowFlg',
+        'hidCommunityId',
+        'hidCommKcd',
+        'hidCommBcd',
+        'hidCheckSelectFlg',
+        'hidSwfFileName',
+        'hidFlg',
+        'hidUsers',
+        'hidListCnt',
+        'hidLogoutFlg',
+        'hidLoginID',
+        'hidSessionKey',
+        'hidPankuzuSessionKey',
+        'ControllerParameters',
+        'hidTabId',
+        'hidMenuId',
+        'hidDesignId',
+        'hidURL',
+    ),
+    form_only=True)
+
+COURSE_DETAIL_REDIRECT = RequestTemplate(
+    'course_detail_redirect',
+    'url-encoded',
+    fields=(
+        'ControllerParameters',
+        'hidCommunityId',
+        'hidCommKcd',
+        'hidCommBcd',
+        'hidFolderId',
+        'hidContentsId',
+        'hidListMode',
+        'hidEditButton',
+        'hidInputFuncType',
+        'hidsocial_no',
+        'hidDesignInfo',
+        'simpletype',
+        'SessionIdEncodeKey',
+        'hidAdmission',
+    ))
+
+LECTURE_DETAIL = RequestTemplate(
+    'lecture_detail',
+    'multipart-form',
+    fields=(
+        'hidCurrentViewID',
+        'hidCloseFlg',
+        'hidSessionDelFlg',
+        'hidContactFunTypeCd',
+        'hidContactFolderId',
+        'hidContactCommunityId',
+        'hidContactContentsId',
+        'hidKamokuId',
+        'hidSessionTimeOut',
+        'hidWarningForSessionTimeOut',
+        'hidWarningForSessionTimeOutDispLogin',
+        'xpoint',
+        'ypoint',
+        'tagname',
+        'SessionIdEncodeKey',
+        'hidAdmKey01',
+        'hidAdmKey04',
+        'hidAdmKey05',
+        'hidAdmKey06',
+        'hidAdmKey08',
+        'hidAdmKey90',
+        'hidAdmKey91',
+        'hidFolderId',
+        'hidContentsId',
+        'hidListMode',
+        'hidZX21PageNo',
+        'hidInputFuncType',
+        'hidEditButton',
+        'hidInputMode',
+        'hidSelectList',
+        'hidFileId',
+        'hidCommentDisp',
+        'hidCommunityId',
+        'hidCommKcd',
+        'hidCommBcd',
+        'hidPankuzuFlg',
+        'hidsocial_no',
+        'hidTabId',
+        'hidZX22PageNo',
+        'hidAddation_back',
+        'hidAnimationSign',
+        'hidJudgeFlg',
+        'simpletype',
+        'HID_P3',
+        'HID_P14',
+        'HID_P41',
+        'HID_P42',
+        'HID_P43',
+        'HID_P44',
+        'HID_P45',
+        'hidURL',
+        'hidListToHistory',
+        'hidFlg',
+        'hidUsers',
+        'hidDesignFlg',
+        'hidLanguage',
+        'hidSessionKey',
+        'hidSessionKeyFlg',
+        'hidPankuzuSessionKey',
+        'hidScrollTop',
+        'hidDisplayNone',
+    ),
+    defaults={
+        'selMakeCombo': '',
+    })
+
+# Fields read from the response of each step, i.e. by the template of the
+# step taken next from it
+PAGE_FIELDS = {
+    'login_page': LOGIN.fields,
+    'login': LOGIN_REDIRECT.fields,
+    'login_redirect': COURSE_DETAIL.fields,
+    'resume_session': COURSE_DETAIL.fields,
+    'course_detail': COURSE_DETAIL_REDIRECT.fields,
+    'course_detail_redirect': LECTURE_DETAIL.fields,
+}
+
 
 class CourseNaviInterface:
-    def __init__(self):
-        self.email = keyring.get_password('cnavi-cli-email', 'cnaviauth')
-        self.password = keyring.get_password('cnavi-cli-password', 'cnaviauth')
-        self.base_url = 'https://cnavi.waseda.jp/index.php'
+    def __init__(self, parser='html5lib', restrict=False, stream=False,
+                 session_cache=None, response_cache=None, base_url=BASE_URL,
+                 proxy=None, metrics=None, throttle=None, parse_pool=None,
+                 email=None, password=None, insecure=False):
+        """parser         -- HTML parser backend, one of `PARSERS`
+        restrict       -- only build the elements callers read (ignored by
+                          'html5lib', which does not support restricted
+                          parsing)
+        stream         -- extract pages that are only read for their form
+                          fields incrementally as the response arrives,
+                          without building a tree
+        session_cache  -- SessionCache to resume and save logged-in
+                          sessions with
+        response_cache -- ResponseCache to serve repeated requests from
+        base_url       -- URL of CourseN@vi's index.php
+        proxy          -- proxy URL for all traffic, e.g. socks5://host:port
+                          (defaults to $CNAVI_PROXY)
+        metrics        -- Metrics to record the timings of every request in
+        throttle       -- Throttle to rate limit and retry requests with
+                          (requests are sent once without a timeout if
+                          None)
+        parse_pool     -- concurrent.futures.ProcessPoolExecutor to parse
+                          pages in. Pages are then returned as Pages
+                          instead of soupified HTML.
+        email          -- CourseN@vi email (defaults to the keyring)
+        password       -- CourseN@vi password (defaults to the keyring)
+        insecure       -- do not verify TLS certificates, e.g. so that a
+                          proxy can inspect traffic
+        """
+        if parser not in PARSERS:
+            raise ConfigError(f'Invalid parser: {parser}')
+
+        self.parser = parser
+        self.restrict = restrict
+        self.stream = stream
+        self.session_cache = session_cache
+        self.response_cache = response_cache
+        self.metrics = metrics
+        self.throttle = throttle
+        self.parse_pool = parse_pool
+        self._dashboard_form = None
+        # Navigation state to replay after the session expired, see
+        # `_relogin()`
+        self._selected_dashboard = None
+        self._selected_course = None
+        # Threads and clones fetching lectures, see `select_lectures()`
+        self._executor = None
+        self._executor_size = None
+        self._local = threading.local()
+        self._clones = []
+        self._clones_lock = threading.Lock()
+        # Courses returned by `get_courses()`, updated on re-login too
+        self._listed_courses = []
+        # hidCommunityId of the course open on the server, and the fields
+        # posted to the course detail redirect that opened it
+        self._open_course = None
+        self._open_params = None
+        self.email = email or keyring.get_password('cnavi-cli-email',
+                                                   'cnaviauth')
+        self.password = password or keyring.get_password('cnavi-cli-password',
+                                                         'cnaviauth')
+        self.base_url = base_url
         self.session = requests.Session()
-        self.cache = {}
 
-        # --- TEMP for proxying traffic from requests
-        self.session.proxies = {
-            'http': 'socks5://localhost:8080',
-            'https': 'socks5://localhost:8080',
-        }
-        self.verify = False
-        # ----
+        proxy = proxy or os.environ.get('CNAVI_PROXY')
+        if proxy:
+            self.session.proxies = {
+                'http': proxy,
+                'https': proxy,
+            }
+        self.verify = not insecure
 
-        self.headers = {
+        # Never modified, so that requests may share it across threads
+        self.headers = MappingProxyType({
             'Accept':          'text/html,application/xhtml+xml,'
                                    + 'application/xml;q=0.9,'
                                    + 'image/webp,image/apng,*/*;'
@@ -32,7 +610,7 @@ class CourseNaviInterface:
             'Accept-Language': 'en-US,en;q=0.9',
             'Cache-Control':   'max-age=0',
             'Content-Type':    'application/x-www-form-urlencoded',
-            'Origin':          'https://cnavi.waseda.jp',
+            'Origin':          _origin(base_url),
             'Referer':         self.base_url,
             'Sec-Fetch-Site':  'same-origin',
             'Sec-Fetch-Mode':  'navigate',
@@ -42,72 +620,290 @@ class CourseNaviInterface:
                                    + 'Safari/537.36',
 
             'Upgrade-Insecure-Requests': '1',
-        }
+        })
     
     def login(self):
-        """Login to the dashboard and return the response."""
+        """Login to the dashboard and return the response.
+
+        If `self.session_cache` holds a session that has not expired, it is
+        resumed with a single request instead of the three needed to login,
+        falling back to a full login if the server no longer accepts it.
+        """
+        self._forget_navigation()
+        if self.session_cache is not None:
+            dashboard = self._resume_session()
+            if dashboard is not None:
+                return dashboard
+
         dummy = self._login()
         dashboard = self._login_redirect(dummy)
+        self.save_session(dashboard)
 
         return dashboard
 
-    def select_course(self, course, dashboard):
-        """Select a course in the dashboard and return the response.
+    def refresh(self, dashboard):
+        """Reload the dashboard to keep the session alive and return it.
 
-        course    -- Soupified HTML of a single course row
-        dashboard -- Soupified HTML of entire dashboard
+        Logs in again if the session has already expired.
+
+        dashboard -- FormState of the latest dashboard
         """
-        hidden_fields = course.find(attrs={'class': 'w-col6'})
-        ad_hoc_fields = course.find(attrs={'class': 'w-col1'})
-        course_data = (hidden_fields, ad_hoc_fields)
+        # The dashboard may reset which course the server has open
+        self._forget_navigation()
+        params = self._login_redirect_params(dashboard)
+        page = self._post(self.base_url, RESUME_SESSION, params)
+        if not FormState.of(page).is_logged_in():
+            self.session.cookies.clear()
+            return self.login()
 
-        dummy = self._course_detail(course_data, dashboard)
-        course_detail = self._course_detail_redirect(dummy)
+        self.save_session(page)
+        return page
 
-        return course_detail
+    def save_session(self, dashboard=None):
+        """Save the session to `self.session_cache`, if any.
+
+        The session's expiry is predicted from `hidSessionTimeOut`, counting
+        from now.
+
+        dashboard -- Soupified HTML of the latest dashboard (defaults to the
+                     last one saved)
+        """
+        if self.session_cache is None:
+            return
+        if dashboard is not None:
+            self._dashboard_form = FormState.of(dashboard)
+
+        self.session_cache.save(self.session.cookies,
+                                self._dashboard_form.fields,
+                                self._dashboard_form.session_timeout())
+
+    def select_course(self, course, dashboard):
+        """Select a course in the dashboard and return a Page of its course
+        detail, with its FormState and Lectures.
+
+        Opening a course takes two requests. Returning to the course the
+        server still has open takes only the second one, which reloads the
+        course detail.
+
+        If the session expired, logs in again and retries; dashboard and
+        course are then updated in place to the new session's.
+
+        course    -- Course returned by `get_courses()`
+        dashboard -- FormState of entire dashboard
+        """
+        self._selected_dashboard = dashboard
+        self._selected_course = course
+        for attempt in range(RELOGIN_ATTEMPTS + 1):
+            try:
+                return self._select_course(course, dashboard)
+            except SessionExpiredError:
+                if attempt == RELOGIN_ATTEMPTS:
+                    raise
+                self._relogin()
 
     def select_lecture(self, lecture, course_detail):
         """Select a lecture and return the response.
 
-        lecture       -- Soupified HTML of a single lecture row
-        course_detail -- Soupified HTML of entire course detail
-        """
-        lecture_detail = self._lecture_detail(lecture, course_detail)
+        If the session expired, logs in again, reopens the course last
+        selected and retries; course_detail is then updated in place to the
+        new session's.
 
-        return lecture_detail
+        lecture       -- Lecture returned by `get_lectures()`
+        course_detail -- FormState of entire course detail
+        """
+        for attempt in range(RELOGIN_ATTEMPTS + 1):
+            try:
+                return self._lecture_detail(lecture, course_detail)
+            except SessionExpiredError:
+                if attempt == RELOGIN_ATTEMPTS:
+                    raise
+                self._recover(course_detail)
+
+    def select_lectures(self, lectures, course_detail, max_workers=4,
+                        verify=False):
+        """Select several lectures concurrently and return their responses.
+
+        A lecture detail is a single POST that only depends on the course
+        detail and the lecture row, so lectures are fetched in parallel by
+        clones of this interface sharing its cookies. The clones and their
+        threads are kept for later calls, so that their connections are
+        reused, until `close()`. With max_workers=1, lectures are fetched
+        by this interface itself. Responses are returned in the order of
+        `lectures`.
+
+        lectures      -- list of Lectures returned by `get_lectures()`
+        course_detail -- FormState of entire course detail
+        max_workers   -- maximum number of requests in flight
+        verify        -- also select the lectures one at a time and raise
+                         ConcurrencyError if any response differs, to check
+                         that the server tolerates concurrent requests
+        """
+        def select(api, lecture):
+            try:
+                return api._lecture_detail(lecture, course_detail)
+            except SessionExpiredError:
+                return None
+
+        def select_all(lectures):
+            if max_workers == 1:
+                return [select(self, lecture) for lecture in lectures]
+            executor = self._lecture_executor(max_workers)
+            return list(executor.map(
+                lambda lecture: select(self._thread_clone(), lecture),
+                lectures))
+
+        lecture_details = select_all(lectures)
+        for attempt in range(RELOGIN_ATTEMPTS + 1):
+            expired = [index
+                       for index, lecture_detail in enumerate(lecture_details)
+                       if lecture_detail is None]
+            if not expired:
+                break
+            if attempt == RELOGIN_ATTEMPTS:
+                raise SessionExpiredError('Session expired again after '
+                                          + 'logging in again')
+            # Clones share the session, so it is recovered once for all of
+            # them
+            self._recover(course_detail)
+            retried = select_all([lectures[index] for index in expired])
+            for index, lecture_detail in zip(expired, retried):
+                lecture_details[index] = lecture_detail
+
+        if verify:
+            for lecture, lecture_detail in zip(lectures, lecture_details):
+                expected = self.select_lecture(lecture, course_detail)
+                if _page_text(expected) != _page_text(lecture_detail):
+                    raise ConcurrencyError('Concurrent lecture detail '
+                                           + 'differs from sequential one')
+
+        return lecture_details
 
     def get_courses(self, dashboard):
-        """Return a list of tuples of courses' titles and respective HTML.
+        """Return a list of the Courses on the dashboard.
 
         Intended to be called on the return value of `self.login()` to extract
         relevant course data.
 
-        dashboard -- Soupified HTML of entire dashboard
+        dashboard -- Soupified HTML or Page of entire dashboard
+
+        Courses carry parameters of the session they were listed in. If the
+        session expires and the interface logs in again, they are updated in
+        place to the new session's.
         """
-        rows = dashboard.find_all(attrs={'class': 'w-conbox'})
-        date_of = lambda row: row.find(attrs={'class': 'w-col4'}).text
-        is_course = lambda row: self._is_valid_date(date_of(row))
-        return [(self._get_course_title(row), row)
-                for row in rows
-                if is_course(row)]
+        courses = self._extract_courses(dashboard)
+        self._listed_courses = courses
+        return courses
+
+    def _extract_courses(self, dashboard):
+        if isinstance(dashboard, Page):
+            return list(dashboard.courses)
+
+        with self._timed('get_courses', 'extract'):
+            rows = dashboard.find_all(attrs={'class': 'w-conbox'})
+            date_of = lambda row: row.find(attrs={'class': 'w-col4'}).text
+            is_course = lambda row: self._is_valid_date(date_of(row))
+            return [self._course(row) for row in rows if is_course(row)]
 
     def get_lectures(self, course_detail):
-        """Return a list of tuples of lectures' titles and respective HTML.
+        """Return a list of the Lectures on a course detail.
 
         Intended to be called on the return value of `self.select_course()` to extract
         relevant lecture data.
 
-        course_detail -- Soupified HTML of entire course detail
+        course_detail -- Soupified HTML or Page of entire course detail
         """
-        rows = course_detail.find_all(attrs={'class': 'c-mblock'})
-        titles = [self._get_lecture_title(row) for row in rows]
-        is_lecture_title = lambda title: title != 'お知らせ'
-        lectures = [(title, row)
-                    for (title, row) in zip(titles, rows)
-                    if is_lecture_title(title)]
+        if isinstance(course_detail, Page):
+            return list(course_detail.lectures)
+
+        with self._timed('get_lectures', 'extract'):
+            rows = course_detail.find_all(attrs={'class': 'c-mblock'})
+            titles = [self._get_lecture_title(row) for row in rows]
+            is_lecture_title = lambda title: title != 'お知らせ'
+            lectures = [self._lecture(title, row)
+                        for (title, row) in zip(titles, rows)
+                        if is_lecture_title(title)]
 
         return lectures
 
+    def get_attachments(self, lecture_detail):
+        """Return a list of tuples of attachments' file names and URLs.
+
+        Intended to be called on the return value of `self.select_lecture()`.
+        Any link to a file with one of `ATTACHMENT_EXTENSIONS` counts as an
+        attachment.
+
+        lecture_detail -- Soupified HTML or Page of entire lecture detail
+        """
+        if isinstance(lecture_detail, Page):
+            return list(lecture_detail.attachments)
+
+        attachments = []
+        seen = set()
+        with self._timed('get_attachments', 'extract'):
+            for link in lecture_detail.find_all('a', href=True):
+                url = urljoin(self.base_url, link['href'])
+                path = unquote(urlparse(url).path)
+                if not path.lower().endswith(ATTACHMENT_EXTENSIONS):
+                    continue
+                if url not in seen:
+                    seen.add(url)
+                    attachments.append((os.path.basename(path), url))
+
+        return attachments
+
+    def fetch_attachment(self, url, headers=None):
+        """GET an attachment and return the streamed response.
+
+        Attachments are downloaded in other threads while this interface
+        keeps crawling, so each thread downloads with its own clone.
+
+        url     -- URL of the attachment
+        headers -- extra request headers
+        """
+        api = self._thread_clone()
+        # Files are stored as sent, so that a download resumed with Range
+        # counts the same bytes
+        headers = {**self.headers, 'Accept-Encoding': 'identity',
+                   **(headers or {})}
+        del headers['Content-Type']
+
+        def send(timeout):
+            return api.session.get(url,
+                                   headers=headers,
+                                   verify=self.verify,
+                                   stream=True,
+                                   timeout=timeout or ATTACHMENT_TIMEOUT)
+
+        return self._send('attachment', send)
+
+    def _course(self, course):
+        """Return the Course of a course row.
+
+        course -- Soupified HTML of a single course row
+        """
+        hidden_fields = FormState.from_soup(course.find(attrs={'class':
+                                                               'w-col6'}))
+        ad_hoc_fields = course.find(attrs={'class': 'w-col1'})
+        return Course(self._get_course_title(course),
+                      {field: hidden_fields.value(field)
+                       for field in COURSE_FIELDS},
+                      self._parse_post_submit_edit(ad_hoc_fields))
+
+    def _lecture(self, title, lecture):
+        """Return the Lecture of a lecture row.
+
+        title   -- title of the lecture
+        lecture -- Soupified HTML of a single lecture row
+        """
+        post_submit = lecture.find(attrs={'class': 'c-read'})
+        ad_hoc_fields = self._parse_post_submit(post_submit)
+        # The row's text covers its visible metadata, e.g. its date
+        fingerprint = hashlib.sha1(json.dumps(
+            [title, ad_hoc_fields, _page_text(lecture)],
+            ensure_ascii=False,
+            sort_keys=True).encode('utf-8')).hexdigest()
+        return Lecture(title, ad_hoc_fields, fingerprint)
+
     def _get_course_title(self, course):
         """Return the title of a course as a string.
 
@@ -122,90 +918,162 @@ class CourseNaviInterface:
         """
         return lecture.find(attrs={'class': 'ta1col-left'})['title'].strip()
 
+    def _select_course(self, course, dashboard):
+        """Open a course and return a Page of its course detail.
+
+        See `select_course()`. The server only accepts the redirect of the
+        course its course detail step opened last, so only the open course
+        can be returned to in one request.
+        """
+        key = course.ad_hoc_fields['hidCommunityId']
+        if self._open_course == key:
+            params = self._open_params
+        else:
+            dummy = self._course_detail(course, dashboard)
+            params = self._course_detail_redirect_params(dummy, course)
+        page = self._post(self.base_url, COURSE_DETAIL_REDIRECT, params)
+
+        course_detail = Page(FormState.of(page),
+                             lectures=self.get_lectures(page))
+        self._open_course = key
+        self._open_params = params
+        return course_detail
+
+    def _forget_navigation(self):
+        """Forget the course opened, e.g. once the session is replaced."""
+        self._open_course = None
+        self._open_params = None
+
+    def _relogin(self):
+        """Login again after the session expired and return the dashboard.
+
+        The dashboard of the last `select_course()` and every Course listed
+        by `get_courses()` are updated in place to the new session's, so
+        callers still holding them navigate within it.
+        """
+        self.session.cookies.clear()
+        if self.session_cache is not None:
+            self.session_cache.clear()
+        self._forget_navigation()
+        dashboard = self._login_redirect(self._login())
+        self.save_session(dashboard)
+
+        if self._selected_dashboard is not None:
+            self._selected_dashboard.fields = FormState.of(dashboard).fields
+
+        fresh = {course.ad_hoc_fields['hidCommunityId']: course
+                 for course in self._extract_courses(dashboard)}
+        stale = list(self._listed_courses)
+        if self._selected_course is not None:
+            stale.append(self._selected_course)
+        for course in stale:
+            new = fresh.get(course.ad_hoc_fields['hidCommunityId'])
+            if new is not None:
+                course.fields = new.fields
+                course.ad_hoc_fields = new.ad_hoc_fields
+        return dashboard
+
+    def _recover(self, course_detail):
+        """Login again after the session expired and replay the navigation
+        to the course last selected: dashboard, course detail and its
+        redirect.
+
+        course_detail is updated in place to the new session's.
+
+        course_detail -- FormState of the course detail in use
+        """
+        if self._selected_course is None:
+            raise SessionExpiredError('Session expired outside of a course')
+        self._relogin()
+        page = self._select_course(self._selected_course,
+                                   self._selected_dashboard)
+        course_detail.fields = page.form.fields
+
+    def _resume_session(self):
+        """Resume the session saved in `self.session_cache`.
+
+        Return the dashboard, or None if there is no saved session or it has
+        expired.
+        """
+        saved = self.session_cache.load()
+        if saved is None:
+            return None
+
+        self.session.cookies.update(saved['cookies'])
+        try:
+            params = self._login_redirect_params(FormState(saved['dashboard']))
+        except InvalidCredentialsError:
+            return None
+
+        dashboard = self._post(self.base_url, RESUME_SESSION, params)
+        if not FormState.of(dashboard).is_logged_in():
+            self.session.cookies.clear()
+            self.session_cache.clear()
+            return None
+
+        self.save_session(dashboard)
+        return dashboard
+
     def _login(self):
         """POST login form and return the dummy response."""
         if not self.email or not self.password:
             raise NoCredentialsError('No email or password found.')
 
-        login_html = self._get(self.base_url)
+        login_form = self._get(self.base_url, form_only=True,
+                               step='login_page')
+        params = self._login_params(login_form)
+
+        return self._post(self.base_url, LOGIN, params)
+
+    def _login_params(self, login_form):
+        """Return the fields to POST for login.
 
+        login_form -- FormState of the login page
+        """
         params = {
             'id': self.email,
             'password': self.password,
-            'vertype': 1,
-            'simpletype': 0,
         }
-        other_fields = [
-            'lang',
-            'ControllerParameters',
-            'ControllerParameters2',
-            'hidSessionKey',
-            'hidSessionKeyFlg',
-            'hidPankuzuSessionKey',
-            'SessionIdEncodeKey',
-            'hidLogin_flg',
-            'hidInquiry', 
-            'hidNameFlg', 
-            'hidAdmission',
-            'hidAdmKey01',
-            'hidAdmKey02',
-            'hidAdmKey03',
-            'hidAdmKey04',
-            'hidAdmKey05',
-            'hidAdmKey06',
-            'hidAdmKey07',
-            'hidAdmKey08',
-            'hidAdmKey90',
-            'hidAdmKey91',
-        ]
-
-        for field in other_fields:
-            params[field] = self._find_value_by_name(login_html, field)
-
-        return self._post(self.base_url, params, 'url-encoded')
+        params.update(LOGIN.params(login_form))
+
+        return params
 
     def _login_redirect(self, dummy):
         """Handle redirect after POSTing for login and return response.
 
-        dummy -- Soupified HTML of initial response after POSTing for login
-        """
-        params = {}
-        fields = [
-            'ControllerParameters',
-            'hidCommunityId',
-            'hidCommKcd',
-            'hidCommBcd',
-            'hidFolderId',
-            'hidContentsId',
-            'hidListMode',
-            'hidEditButton',
-            'hidInputFuncType',
-            'hidsocial_no',
-            'hidDesignInfo',
-            'simpletype',
-            'SessionIdEncodeKey',
-            'hidLogin_flg',
-            'hidAdmission',
-        ]
-
-        for field in fields:
-            try:
-                params[field] = self._find_value_by_name(dummy, field)
-            except NoElementError:
-                raise InvalidCredentialsError('Invalid credentials')
+        dummy -- FormState of initial response after POSTing for login
+        """
+        params = self._login_redirect_params(dummy)
+
+        return self._post(self.base_url, LOGIN_REDIRECT, params)
 
-        return self._post(self.base_url, params, 'url-encoded')
+    def _login_redirect_params(self, dummy):
+        """Return the fields to POST for the redirect after login.
 
-    def _course_detail(self, course_data, dashboard):
+        dummy -- FormState of initial response after POSTing for login
+        """
+        try:
+            return LOGIN_REDIRECT.params(dummy)
+        except NoElementError:
+            raise InvalidCredentialsError('Invalid credentials')
+
+    def _course_detail(self, course, dashboard):
         """POST for course detail on dashboard and return the dummy response.
 
-        course_data -- a tuple of: (<hidden fields>, <ad hoc fields>)
-                       Hidden fields is a soupified <p> tag containing
-                         hidden input fields needed for POST
-                       Ad hoc fields is a soupified <p> tag containing
-                         an onclick function with parameters needed for POST
-        dashboard   -- a soupified HTML of the entire dashboard containing
-                         general input fields
+        See `_course_detail_params()` for arguments.
+        """
+        params = self._course_detail_params(course, dashboard)
+
+        return self._post(self.base_url, COURSE_DETAIL, params)
+
+    def _course_detail_params(self, course, dashboard):
+        """Return the fields to POST for course detail.
+
+        course    -- Course to open. Its fields are the hidden input fields
+                     of the course row needed for POST; its ad hoc fields
+                     are the parameters of the row's onclick function
+        dashboard -- FormState of the entire dashboard containing
+                       general input fields
 
 
         Illustration of `ad hoc fields`
@@ -222,226 +1090,73 @@ class CourseNaviInterface:
           * hidCommunityId -> pull from above
           * hidNewWindowFlg -> set to 1
         """
-        params = {}
-        general_fields = [
-            'hidCurrentViewID',
-            'hidCloseFlg',
-            'hidSessionDelFlg',
-            'hidContactFunTypeCd',
-            'hidContactFolderId',
-            'hidContactCommunityId',
-            'hidContactContentsId',
-            'hidKamokuId',
-            'hidSessionTimeOut',
-            'hidWarningForSessionTimeOut',
-            'hidWarningForSessionTimeOutDispLogin',
-            'xpoint',
-            'ypoint',
-            'tagname',
-            'SessionIdEncodeKey',
-            'hidAdmission',
-            'hidAdmKey01',
-            'hidAdmKey02',
-            'hidAdmKey03',
-            'hidAdmKey04',
-            'hidAdmKey05',
-            'hidAdmKey06',
-            'hidAdmKey07',
-            'hidAdmKey08',
-            'hidAdmKey90',
-            'hidAdmKey91',
-            'hidLanguage',
-            'hidState',
-            'hidCommounity',
-            'hidDesignFlg',
-            'hidCurrentStudyFlg',
-            'simpletype',
-            'hidListMode',
-            'hidFolderId',
-            'hidContentsId',
-            'hidCurrentFolderId',
-            'hidNewListFlg',
-            'hidMenuFlg',
-            'hidEditButton',
-            'hidNewWindowFlg',
-            'hidCommunityId',
-            'hidCommKcd',
-            'hidCommBcd',
-            'hidCheckSelectFlg',
-            'hidSwfFileName',
-            'hidFlg',
-            'hidUsers',
-            'hidListCnt',
-            'hidLogoutFlg',
-            'hidLoginID',
-            'hidSessionKey',
-            'hidPankuzuSessionKey',
-            'ControllerParameters',
-            'hidTabId',
-            'hidMenuId',
-            'hidDesignId',
-            'hidURL',
-        ]
-        specific_fields = [
-            'folder_id[]',
-            'community_name[]',
-            'hdnIcon[]',
-            'communityIdInfo[]',
-            'sequenceInfo[]',
-        ]
-
-        for field in general_fields:
-            params[field] = self._find_value_by_name(dashboard, field)
-        for field in specific_fields:
-            params[field] = self._find_value_by_name(course_data[0], field)
-            self.cache[field] = params[field]
+        ad_hoc_fields = course.ad_hoc_fields
+        values = dict(course.fields)
+        values['ControllerParameters'] = ad_hoc_fields['ControllerParameters']
+        values['hidFolderId'] = ad_hoc_fields['hidFolderId']
+        values['hidCommunityId'] = ad_hoc_fields['hidCommunityId']
+        values['hidNewWindowFlg'] = '1'
+
+        return COURSE_DETAIL.params(dashboard, values)
+
+    def _course_detail_redirect_params(self, dummy, course):
+        """Return the fields to POST for the redirect after course detail.
+
+        dummy  -- FormState of initial response after POSTing for course
+                  detail
+        course -- Course that was posted to course detail
+
+        Dummy contains a value for every field of `COURSE_DETAIL_REDIRECT`.
+        For `community_name[]`, `communityIdInfo[]` and `folder_id[]`, the
+        values of the course that were initially posted to course_detail are
+        reused to prevent parser error.
+        """
+        values = {
+            'community_name[]': course.fields['community_name[]'],
+            'communityIdInfo[]': course.fields['communityIdInfo[]'],
+            'folder_id[]': course.fields['folder_id[]'],
+        }
 
-        # Ad hoc headers
-        post_submit_edit = course_data[1]
-        ad_hoc_fields = self._parse_post_submit_edit(post_submit_edit)
-        params['ControllerParameters'] = ad_hoc_fields['ControllerParameters']
-        params['hidFolderId'] = ad_hoc_fields['hidFolderId']
-        params['hidCommunityId'] = ad_hoc_fields['hidCommunityId']
-        params['hidNewWindowFlg'] = '1'
-
-        return self._post(self.base_url, params, 'multipart-form')
-
-    def _course_detail_redirect(self, dummy):
-        """Handle redirect after POSTing for course detail and return response.
-
-        dummy -- Soupified HTML of initial response after POSTing for course
-                 detail
-
-        Dummy contains a value for every field in `general_fields`.
-        For fields in `specific_fields`, the values that were intially posted
-        to course_detail and stored in self.cache are reused to prevent parser
-        error.
-        """
-        params = {}
-        general_fields = [
-            'ControllerParameters',
-            'hidCommunityId',
-            'hidCommKcd',
-            'hidCommBcd',
-            'hidFolderId',
-            'hidContentsId',
-            'hidListMode',
-            'hidEditButton',
-            'hidInputFuncType',
-            'hidsocial_no',
-            'hidDesignInfo',
-            'simpletype',
-            'SessionIdEncodeKey',
-            'hidAdmission',
-        ]
-        specific_fields = [
-            'community_name[]',
-            'communityIdInfo[]',
-            'folder_id[]',
-        ]
-
-        for field in general_fields:
-            params[field] = self._find_value_by_name(dummy, field)
-        for field in specific_fields:
-            params[field] = self.cache[field]
-
-        return self._post(self.base_url, params, 'url-encoded')
+        return COURSE_DETAIL_REDIRECT.params(dummy, values)
 
     def _lecture_detail(self, lecture, course_detail):
-        params = {
-            'selMakeCombo': '',
-        }
-        fields = [
-            'hidCurrentViewID',
-            'hidCloseFlg',
-            'hidSessionDelFlg',
-            'hidContactFunTypeCd',
-            'hidContactFolderId',
-            'hidContactCommunityId',
-            'hidContactContentsId',
-            'hidKamokuId',
-            'hidSessionTimeOut',
-            'hidWarningForSessionTimeOut',
-            'hidWarningForSessionTimeOutDispLogin',
-            'xpoint',
-            'ypoint',
-            'tagname',
-            'SessionIdEncodeKey',
-            'hidAdmKey01',
-            'hidAdmKey04',
-            'hidAdmKey05',
-            'hidAdmKey06',
-            'hidAdmKey08',
-            'hidAdmKey90',
-            'hidAdmKey91',
-            'hidFolderId',
-            'hidContentsId',
-            'hidListMode',
-            'hidZX21PageNo',
-            'hidInputFuncType',
-            'hidEditButton',
-            'hidInputMode',
-            'hidSelectList',
-            'hidFileId',
-            'hidCommentDisp',
-            'hidCommunityId',
-            'hidCommKcd',
-            'hidCommBcd',
-            'hidPankuzuFlg',
-            'hidsocial_no',
-            'hidTabId',
-            'hidZX22PageNo',
-            'hidAddation_back',
-            'hidAnimationSign',
-            'hidJudgeFlg',
-            'simpletype',
-            'HID_P3',
-            'HID_P14',
-            'HID_P41',
-            'HID_P42',
-            'HID_P43',
-            'HID_P44',
-            'HID_P45',
-            'hidURL',
-            'hidListToHistory',
-            'hidFlg',
-            'hidUsers',
-            'hidDesignFlg',
-            'hidLanguage',
-            'hidSessionKey',
-            'hidSessionKeyFlg',
-            'hidPankuzuSessionKey',
-            'hidScrollTop',
-            'hidDisplayNone',
-        ]
-
-        for field in fields:
-            params[field] = self._find_value_by_name(course_detail, field)
+        """POST for lecture detail and return the response.
 
+        lecture       -- Lecture to open
+        course_detail -- FormState of entire course detail
+        """
+        params = self._lecture_detail_params(lecture, course_detail)
+
+        # A lecture whose row changed may have changed inside too
+        return self._post(self.base_url, LECTURE_DETAIL, params,
+                          context=lecture.fingerprint)
+
+    def _lecture_detail_params(self, lecture, course_detail):
+        """Return the fields to POST for lecture detail.
+
+        lecture       -- Lecture to open
+        course_detail -- FormState of entire course detail
+        """
         # TODO: hidListMode, hidFolderId, hidContents should be present in course_detail but is not
         # -> results in 500 response
 
         # Ad hoc headers
-        post_submit = lecture.find(attrs={'class': 'c-read'})
-        ad_hoc_fields = self._parse_post_submit(post_submit)
-        params['ControllerParameters'] = ad_hoc_fields['ControllerParameters']
-        params['hidAdmKey02'] = ad_hoc_fields['hidAdmKey02']
-        params['hidAdmKey03'] = ad_hoc_fields['hidAdmKey03']
-        params['hidAdmKey07'] = ad_hoc_fields['hidAdmKey07']
-        params['hidNewWindowFlg'] = ad_hoc_fields['hidNewWindowFlg']
-        params['hidLectureFlg'] = ad_hoc_fields['hidLectureFlg']
-        params['hidAdmission'] = ad_hoc_fields['hidAdmission']
+        ad_hoc_fields = lecture.ad_hoc_fields
+        values = {
+            'ControllerParameters': ad_hoc_fields['ControllerParameters'],
+            'hidAdmKey02': ad_hoc_fields['hidAdmKey02'],
+            'hidAdmKey03': ad_hoc_fields['hidAdmKey03'],
+            'hidAdmKey07': ad_hoc_fields['hidAdmKey07'],
+            'hidNewWindowFlg': ad_hoc_fields['hidNewWindowFlg'],
+            'hidLectureFlg': ad_hoc_fields['hidLectureFlg'],
+            'hidAdmission': ad_hoc_fields['hidAdmission'],
+        }
 
-        return self._post(self.base_url, params, 'multipart-form')
+        return LECTURE_DETAIL.params(course_detail, values)
 
     def _is_valid_date(self, string):
         """Return True if string has a valid date format. False otherwise."""
-        ids = ['月', '火', '水', '木', '金', '土',
-               'Mon', 'Tues', 'Wed', 'Thur', 'Fri', 'Sat']
-        for id in ids:
-            if string.startswith(id):
-                return True
-        return False
+        return string.startswith(DAY_PREFIXES)
 
     def _parse_post_submit_edit(self, html):
         """Parse ad hoc fields from function `post_submit_edit()` in HTML.
@@ -462,7 +1177,7 @@ class CourseNaviInterface:
         func = html.find('a')['onclick']
 
         # Returns: ['foo', 'bar', '', 'baz']
-        args = re.findall("(?<=')([^',]*)(?=')", func)
+        args = QUOTED_ARGUMENT.findall(func)
 
         fields = {
             'ControllerParameters': args[0],
@@ -490,7 +1205,7 @@ class CourseNaviInterface:
         func = html.find('a')['onclick']
 
         # Returns: ['foo', 'bar', '', 'baz']
-        args = re.findall("(?<=')([^',]*)(?=')", func)
+        args = QUOTED_ARGUMENT.findall(func)
 
         fields = {
             'ControllerParameters': args[0],
@@ -504,59 +1219,315 @@ class CourseNaviInterface:
 
         return fields
 
-    def _find_value_by_name(self, html, name):
-        """Find an HTML element with a given name and return its value.
+    def close(self):
+        """Close the connections of this interface and of its clones, and
+        stop the threads fetching lectures.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        with self._clones_lock:
+            for clone in self._clones:
+                clone.session.close()
+            self._clones = []
+            self._local = threading.local()
+        self.session.close()
+
+    def _lecture_executor(self, max_workers):
+        """Return the thread pool fetching lectures, with max_workers
+        threads.
+        """
+        if self._executor is not None and self._executor_size != max_workers:
+            self._executor.shutdown()
+            self._executor = None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+            self._executor_size = max_workers
+        return self._executor
+
+    def _thread_clone(self):
+        """Return the clone of this interface owned by the current thread.
+
+        Clones outlive the course and the session they were made in, so the
+        course open on the server and the cookies are copied again from this
+        interface on every call.
+        """
+        clone = getattr(self._local, 'api', None)
+        if clone is None:
+            clone = self._local.api = self._clone()
+            with self._clones_lock:
+                self._clones.append(clone)
+        else:
+            clone.session.cookies = self.session.cookies.copy()
+        clone._open_course = self._open_course
+        return clone
 
-        Name refers to an HTML tag's <name=""> attribute, while value refers
-        to an HTML tag's <value=""> attribute.
+    def _clone(self):
+        """Return a copy of this interface with its own session.
 
-        html -- Soupified HTML
-        name -- queried name
+        The clone shares cookies (and so the server-side session) with this
+        interface, but can be driven from another thread.
         """
-        element = html.find(attrs={'name': name})
-        if element is None:
-            raise NoElementError(f'No element found for "name={name}"')
-        try:
-            return element['value']
-        except KeyError:
-            raise NoElementError(f'No value for element with "name={name}"')
+        clone = copy.copy(self)
+        clone.session = requests.Session()
+        clone.session.cookies = self.session.cookies.copy()
+        clone.session.proxies = dict(self.session.proxies)
+        return clone
+
+    def _get(self, url, form_only=False, step='request'):
+        """Make a GET request and return a soupified response.
+
+        url       -- requested URL
+        form_only -- return only the FormState of the response
+        step      -- navigation step name the request is recorded under
+        """
+        key = self._cache_key('GET', url, step=step)
+        html = self._cached(key, step)
+        if html is not None:
+            return self._parse_text(html, form_only, step)
 
-    def _get(self, url):
-        """Make a GET request and return a soupified response."""
-        response = self.session.get(url,
+        def send(timeout):
+            return self.session.get(url,
                                     headers=self.headers,
-                                    verify=self.verify)
-        return self._soupify(response.text)
-
-    def _post(self, url, params, content_type):
-        """Make a POST request and return a soupified response."""
-        if content_type == 'url-encoded':
-            self.headers['Content-Type'] = 'application/x-www-form-urlencoded'
-            response = self.session.post(url,
-                                         data=params,
-                                         headers=self.headers,
-                                         verify=self.verify)
-        elif content_type == 'multipart-form':
-            multipart = MultipartEncoder(fields=params)
-            self.headers['Content-Type'] = multipart.content_type
-            response = self.session.post(url,
-                                         data=multipart,
-                                         headers=self.headers,
-                                         verify=self.verify)
-        else:
-            raise InvalidContentTypeError(f'Invalid keyword: {content_type}')
+                                    verify=self.verify,
+                                    stream=self._streams(form_only),
+                                    timeout=timeout)
+
+        start = time.perf_counter()
+        response = self._send(step, send)
+        return self._parse(response, form_only, step, start, key)
+
+    def _post(self, url, template, params, context=None):
+        """Make a POST request and return a soupified response, or only its
+        FormState if the template is form-only.
+
+        url      -- requested URL
+        template -- RequestTemplate of the navigation step
+        params   -- form fields to POST, see `RequestTemplate.params()`
+        context  -- what else the response depends on, for its cache key
+        """
+        form_only = template.form_only
+        key = self._cache_key('POST', url, params, template.step, context)
+        html = self._cached(key, template.step)
+        if html is not None:
+            return self._parse_text(html, form_only, template.step)
+
+        stream = self._streams(form_only)
+
+        def send(timeout):
+            headers, data = template.encode(params, self.headers)
+            return self.session.post(url,
+                                     data=data,
+                                     headers=headers,
+                                     verify=self.verify,
+                                     stream=stream,
+                                     timeout=timeout)
+
+        start = time.perf_counter()
+        response = self._send(template.step, send)
+        return self._parse(response, form_only, template.step, start, key)
+
+    def _send(self, step, send):
+        """Send a request through `self.throttle`, if any, and return the
+        response.
+
+        step -- navigation step name of the request
+        send -- callable taking a timeout and sending the request
+        """
+        if self.throttle is None:
+            return send(None)
+        return self.throttle.send(step, send)
 
-        return self._soupify(response.text)
+    def _streams(self, form_only):
+        """Return True if a response should be streamed into the extractor.
 
-    def _soupify(self, html):
+        Cached responses are stored whole, so nothing is streamed while a
+        response cache is in use.
+        """
+        return self.stream and form_only and self.response_cache is None
+
+    def _cache_key(self, method, url, params=None, step='request',
+                   context=None):
+        """Return the response cache key of a request, or None if it is not
+        to be cached (see `CACHED_STEPS`).
+
+        A lecture detail depends on the course open on the server as well as
+        on the fields posted, so the key includes the open course, and the
+        context given, e.g. the fingerprint of the lecture's row.
+        """
+        if self.response_cache is None or step not in CACHED_STEPS:
+            return None
+        return self.response_cache.fingerprint(
+            method, url, params, context=[self._open_course, context])
+
+    def _cached(self, key, step):
+        """Return the cached body of a request, if any."""
+        if key is None:
+            return None
+        start = time.perf_counter()
+        html = self.response_cache.get(key)
+        if html is not None:
+            self._record(step, 'cache', time.perf_counter() - start)
+        return html
+
+    def _parse(self, response, form_only, step, start, key=None):
+        """Parse a response into soupified HTML or, if form_only, a FormState.
+
+        In streaming mode, form-only responses are extracted chunk by chunk
+        while they are downloaded instead of being read and parsed whole.
+        Successful responses are stored in the response cache under key.
+        Raise requests.HTTPError if the response is an error, i.e. once the
+        Throttle's retries ran out, and SessionExpiredError if a step of
+        `SESSION_STEPS` was answered with the login page.
+
+        step  -- navigation step name the response is recorded under
+        start -- `time.perf_counter()` when the request was sent
+        """
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+
+        if self._streams(form_only):
+            received = time.perf_counter()
+            self._record(step, 'network', received - start)
+            extractor = extract_stream(response, STREAM_CHUNK_SIZE)
+            self._record(step, 'stream', time.perf_counter() - received,
+                         extractor.size)
+            form = FormState(extractor.fields)
+            if step in SESSION_STEPS and 'password' in form.fields:
+                raise SessionExpiredError(f'Session expired at {step}')
+            return form
+
+        html = response.text
+        self._record(step, 'network', time.perf_counter() - start,
+                     len(response.content))
+        if step in SESSION_STEPS and LOGIN_FORM.search(html):
+            raise SessionExpiredError(f'Session expired at {step}')
+        if key is not None:
+            self.response_cache.put(key, html)
+        return self._parse_text(html, form_only, step)
+
+    def _parse_text(self, html, form_only, step='request'):
+        """Parse an HTML string into soupified HTML or, if form_only, a
+        FormState.
+
+        With a parse pool, the page is parsed and extracted in another
+        process and returned as a Page instead of soupified HTML.
+        """
+        if self.parse_pool is not None:
+            with self._timed(step, 'parse'):
+                page = self.parse_pool.submit(parse_page, html, self.parser,
+                                              self.restrict, self.base_url,
+                                              form_only, step).result()
+            return page.form if form_only else page
+
+        with self._timed(step, 'parse'):
+            soup = self._soupify(html, step)
+        if form_only:
+            with self._timed(step, 'extract'):
+                return FormState.from_soup(soup)
+        return soup
+
+    def _soupify(self, html, step='request'):
         """Convert a given HTML string to an instance of BeautifulSoup.
 
-        The parser 'html5lib' is used over the built-in 'html.parser' because
-        there were issues where 'html.parser' failed to read certain values in
-        large HTML strings.
+        step -- navigation step the page is the response of, which decides
+                the fields it must have (see `PAGE_FIELDS`)
         """
+        return soupify(html, self.parser, self.restrict,
+                       PAGE_FIELDS.get(step, REQUIRED_FIELDS))
+
+    def _timed(self, step, phase):
+        """Return a context manager recording the time spent in it."""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.time(step, phase)
+
+    def _record(self, step, phase, seconds, size=0):
+        if self.metrics is not None:
+            self.metrics.record(step, phase, seconds, size)
+
+
+def soupify(html, parser='html5lib', restrict=False,
+            fields=REQUIRED_FIELDS):
+    """Convert a given HTML string to an instance of BeautifulSoup.
+
+    'html5lib' is the default because there were issues where 'html.parser'
+    failed to read certain values in large HTML strings, so any faster
+    backend is validated against the fields read from the page and the page
+    is re-parsed in full with 'html5lib' when one of them goes missing.
+
+    html     -- HTML string
+    parser   -- HTML parser backend, one of `PARSERS`
+    restrict -- only build the elements callers read (see
+                `RelevantTagStrainer`)
+    fields   -- names of the elements the page must have
+    """
+    if parser == 'html5lib':
+        return BeautifulSoup(html, 'html5lib')
+
+    parse_only = RelevantTagStrainer() if restrict else None
+    soup = BeautifulSoup(html, parser, parse_only=parse_only)
+    names = {element['name']
+             for element in soup.find_all(attrs={'name': True})}
+    if not names.issuperset(fields):
         return BeautifulSoup(html, 'html5lib')
 
+    return soup
+
+
+def parse_page(html, parser='html5lib', restrict=False, base_url=BASE_URL,
+               form_only=False, step='request'):
+    """Parse an HTML string and return a Page of everything read from it.
+
+    Meant to be run in a parse pool, so arguments and result are picklable.
+
+    html      -- HTML string
+    parser    -- HTML parser backend, one of `PARSERS`
+    restrict  -- only build the elements callers read
+    base_url  -- URL that attachment links are relative to
+    form_only -- only extract the FormState
+    step      -- navigation step the page is the response of
+    """
+    key = (parser, restrict, base_url)
+    if key not in _page_parsers:
+        # Only used to extract pages, never to login
+        _page_parsers[key] = CourseNaviInterface(parser=parser,
+                                                 restrict=restrict,
+                                                 base_url=base_url,
+                                                 email='-',
+                                                 password='-')
+    api = _page_parsers[key]
+
+    soup = api._soupify(html, step)
+    form = FormState.from_soup(soup)
+    if form_only:
+        return Page(form)
+    return Page(form,
+                courses=api.get_courses(soup),
+                lectures=api.get_lectures(soup),
+                attachments=api.get_attachments(soup),
+                text=_page_text(soup))
+
+
+# Interfaces extracting pages in `parse_page()`, one per configuration
+_page_parsers = {}
+
+
+def _origin(url):
+    """Return the origin (scheme and host) of a URL."""
+    parts = urlparse(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def _page_text(html):
+    """Return the visible text of soupified HTML or a Page with whitespace
+    collapsed.
+    """
+    if isinstance(html, Page):
+        return html.text
+    return ' '.join(html.get_text().split())
+
 
 # ---- Custom Errors ----
 
@@ -584,3 +1555,12 @@ class InvalidContentTypeError(Exception):
     def __init__(self, message):
         super().__init__(message)
 
+
+class ConcurrencyError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class SessionExpiredError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
@@ -0,0 +1,194 @@
+import asyncio
+import os
+
+import aiohttp
+from api import (BASE_URL,
+                 COURSE_DETAIL,
+                 COURSE_DETAIL_REDIRECT,
+                 LECTURE_DETAIL,
+                 LOGIN,
+                 LOGIN_REDIRECT,
+                 CourseNaviInterface,
+                 FormState,
+                 Page,
+                 ConcurrencyError,
+                 NoCredentialsError,
+                 _page_text)
+
+
+class AsyncCourseNaviInterface(CourseNaviInterface):
+    """asyncio counterpart of `CourseNaviInterface`.
+
+    `login`, `select_course`, `select_lecture` and `select_lectures` are
+    coroutines; `get_courses` and `get_lectures` are unchanged. Requests are
+    made with aiohttp and HTML is parsed in an executor so that the event
+    loop is never blocked, which lets one process drive many accounts at
+    once.
+
+    Each instance holds one CourseN@vi session, whose navigation state is
+    server-side, so courses of one instance are selected one at a time.
+    Use one instance per concurrent navigation.
+
+    Streaming extraction and throttling are not supported, and aiohttp only
+    supports HTTP proxies.
+    """
+
+    def __init__(self, parser='html5lib', restrict=False, executor=None,
+                 base_url=BASE_URL, proxy=None, email=None, password=None,
+                 insecure=False, cookie_jar=None):
+        """parser     -- HTML parser backend, one of `PARSERS`
+        restrict   -- only build the elements callers read
+        executor   -- concurrent.futures executor to parse HTML in (defaults
+                      to the event loop's default executor)
+        base_url   -- URL of CourseN@vi's index.php
+        proxy      -- HTTP proxy URL for all traffic (defaults to
+                      $CNAVI_PROXY)
+        email      -- CourseN@vi email (defaults to the keyring)
+        password   -- CourseN@vi password (defaults to the keyring)
+        insecure   -- do not verify TLS certificates
+        cookie_jar -- aiohttp.abc.AbstractCookieJar to keep the session's
+                      cookies in (defaults to an aiohttp.CookieJar that also
+                      accepts cookies of IP address hosts)
+        """
+        super().__init__(parser=parser, restrict=restrict, base_url=base_url,
+                         proxy=proxy, email=email, password=password,
+                         insecure=insecure)
+        self.session = None
+        self.executor = executor
+        self.proxy = proxy or os.environ.get('CNAVI_PROXY')
+        self.cookie_jar = cookie_jar
+        self._course_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def login(self):
+        """Login to the dashboard and return the response."""
+        dummy = await self._login()
+        dashboard = await self._post(self.base_url, LOGIN_REDIRECT,
+                                     self._login_redirect_params(dummy))
+
+        return dashboard
+
+    async def select_course(self, course, dashboard):
+        """Select a course in the dashboard and return a Page of its course
+        detail, with its FormState and Lectures.
+
+        course    -- Course returned by `get_courses()`
+        dashboard -- FormState of entire dashboard
+        """
+        async with self._navigation_lock():
+            params = self._course_detail_params(course, dashboard)
+            dummy = await self._post(self.base_url, COURSE_DETAIL, params)
+            params = self._course_detail_redirect_params(dummy, course)
+            course_detail = await self._post(self.base_url,
+                                             COURSE_DETAIL_REDIRECT, params)
+
+        return Page(FormState.of(course_detail),
+                    lectures=self.get_lectures(course_detail))
+
+    async def select_lecture(self, lecture, course_detail):
+        """Select a lecture and return the response.
+
+        lecture       -- Lecture returned by `get_lectures()`
+        course_detail -- FormState of entire course detail
+        """
+        params = self._lecture_detail_params(lecture, course_detail)
+
+        return await self._post(self.base_url, LECTURE_DETAIL, params)
+
+    async def select_lectures(self, lectures, course_detail, max_workers=4,
+                              verify=False):
+        """Select several lectures concurrently and return their responses.
+
+        See `CourseNaviInterface.select_lectures()`.
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def select(lecture):
+            async with semaphore:
+                return await self.select_lecture(lecture, course_detail)
+
+        lecture_details = await asyncio.gather(*[select(lecture)
+                                                 for lecture in lectures])
+
+        if verify:
+            for lecture, lecture_detail in zip(lectures, lecture_details):
+                expected = await self.select_lecture(lecture, course_detail)
+                if _page_text(expected) != _page_text(lecture_detail):
+                    raise ConcurrencyError('Concurrent lecture detail '
+                                           + 'differs from sequential one')
+
+        return list(lecture_details)
+
+    async def _login(self):
+        """POST login form and return the dummy response."""
+        if not self.email or not self.password:
+            raise NoCredentialsError('No email or password found.')
+
+        login_form = await self._get(self.base_url, form_only=True,
+                                     step='login_page')
+        params = self._login_params(login_form)
+
+        return await self._post(self.base_url, LOGIN, params)
+
+    async def _get(self, url, form_only=False, step='request'):
+        """Make a GET request and return a soupified response."""
+        session = self._client_session()
+        async with session.get(url,
+                               headers=self.headers,
+                               proxy=self.proxy,
+                               ssl=None if self.verify else False) as response:
+            html = await response.text()
+
+        return await self._parse_async(html, form_only, step)
+
+    async def _post(self, url, template, params):
+        """Make a POST request and return a soupified response, or only its
+        FormState if the template is form-only.
+        """
+        headers, data = template.encode(params, self.headers)
+        if template.multipart:
+            data = data.to_string()
+
+        session = self._client_session()
+        async with session.post(url,
+                                data=data,
+                                headers=headers,
+                                proxy=self.proxy,
+                                ssl=None if self.verify else False) as response:
+            html = await response.text()
+
+        return await self._parse_async(html, template.form_only,
+                                       template.step)
+
+    async def _parse_async(self, html, form_only, step):
+        """Parse an HTML string in the executor."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor,
+                                          self._parse_text,
+                                          html,
+                                          form_only,
+                                          step)
+
+    def _client_session(self):
+        # aiohttp sessions must be created inside a running event loop
+        if self.session is None:
+            cookie_jar = self.cookie_jar or aiohttp.CookieJar(unsafe=True)
+            self.session = aiohttp.ClientSession(cookie_jar=cookie_jar)
+        return self.session
+
+    def _navigation_lock(self):
+        # asyncio locks must be created inside a running event loop
+        if self._course_lock is None:
+            self._course_lock = asyncio.Lock()
+        return self._course_lock
@@ -1,8 +1,14 @@
 #!/usr/bin/env python
+from contextlib import nullcontext, redirect_stdout
+import sys
+
 import click
-import keyring
 
-from task_manager import TaskManager
+from settings import DEFAULT_ROOT, PARSERS
+
+# Everything else is imported by the commands that need it, so that
+# --help, completion and quick commands do not load the parser and network
+# stack. See bench/bench_startup.py.
 
 @click.group()
 def main():
@@ -10,14 +16,245 @@ def main():
 
 @main.command(help='Download files from CourseNavi')
 @click.option('-a', '--all', is_flag=True,
-              help='Download every file, not just the ones that are new')
+              help='Visit every lecture and download every file, not just '
+                   + 'the ones that are new')
 @click.option('-v', '--verbose', is_flag=True,
-              help='Print more status logs')
+              help='Print more status logs and a summary of request timings')
 @click.option('-d', '--debug', is_flag=True,
-              help='Print status logs for debugging')
-def pull(all, verbose, debug):
-    tm = TaskManager(all=all, verbose=verbose, debug=debug)
-    tm.pull()
+              help='Print status logs and the timing of every request for '
+                   + 'debugging')
+@click.option('-p', '--parser', type=click.Choice(PARSERS),
+              default='html5lib',
+              help='HTML parser backend (falls back to html5lib on error)')
+@click.option('-s', '--stream', is_flag=True,
+              help='Extract form-only pages while they are downloaded')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of logged-in sessions crawling courses at once')
+@click.option('-l', '--lecture-jobs', type=click.IntRange(min=1), default=1,
+              help='Number of lectures fetched at once within a course')
+@click.option('--verify-lectures', is_flag=True,
+              help='Fetch the lectures fetched at once (--lecture-jobs) '
+                   + 'again one at a time and stop if they differ, which '
+                   + 'doubles their requests (for debugging)')
+@click.option('-P', '--parse-workers', type=click.IntRange(min=0), default=0,
+              help='Number of processes parsing pages while sessions keep '
+                   + 'downloading (0 parses in the downloading thread)')
+@click.option('-f', '--fresh-login', is_flag=True,
+              help='Login again instead of resuming the saved session')
+@click.option('-o', '--output', default=DEFAULT_ROOT, show_default=True,
+              type=click.Path(file_okay=False),
+              help='Directory to download files into')
+@click.option('--download-jobs', type=click.IntRange(min=1), default=4,
+              help='Number of files downloaded at once')
+@click.option('--limit-rate', type=click.IntRange(min=1),
+              help='Combined download speed limit in KiB/s')
+@click.option('-c', '--cache', is_flag=True,
+              help='Replay lecture pages from the local response cache when '
+                   + 'possible (for development); logging in and opening '
+                   + 'courses always reach the server')
+@click.option('--proxy', envvar='CNAVI_PROXY',
+              help='Proxy URL for all traffic, e.g. socks5://localhost:8080')
+@click.option('-k', '--insecure', is_flag=True,
+              help='Do not verify TLS certificates, e.g. behind a proxy '
+                   + 'that inspects traffic')
+@click.option('--rate', type=float,
+              help='Maximum requests per second across all sessions and '
+                   + 'downloads')
+@click.option('--retries', type=click.IntRange(min=0), default=3,
+              show_default=True,
+              help='Retries of a request that failed or timed out')
+@click.option('--timeout', type=float, default=30, show_default=True,
+              help='Seconds to wait for the server before giving up on a '
+                   + 'request')
+@click.option('--profile', type=click.Path(dir_okay=False),
+              help='Write the time and bytes spent per navigation step to '
+                   + 'a file')
+@click.option('--profile-format', type=click.Choice(['json', 'folded']),
+              default='json', show_default=True,
+              help='Format of --profile; folded stacks can be fed to '
+                   + 'flamegraph tools')
+@click.option('--favorite', 'favorites', multiple=True, metavar='TITLE',
+              help='Pull courses whose title contains TITLE first (can be '
+                   + 'given several times)')
+@click.option('--newest-first', is_flag=True,
+              help='Pull the lectures listed last in a course first')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'jsonl']),
+              default='text', show_default=True,
+              help='Output; jsonl writes a JSON record of every course, '
+                   + 'lecture and attachment to stdout as soon as it is '
+                   + 'found, and status logs to stderr')
+@click.option('-D', '--daemon', 'use_daemon', is_flag=True,
+              help='Let a running `cnavi serve` pull, with the options it '
+                   + 'was started with (only --all and --verbose apply)')
+def pull(all, verbose, debug, parser, stream, jobs, lecture_jobs,
+         verify_lectures, parse_workers, fresh_login, output, download_jobs, limit_rate,
+         cache, proxy, insecure, rate, retries, timeout, profile,
+         profile_format, favorites, newest_first, output_format, use_daemon):
+    if use_daemon and output_format == 'jsonl':
+        print('[No daemon] `cnavi serve` only pulls with --format text, '
+              + 'pulling without it', file=sys.stderr)
+    elif use_daemon:
+        import daemon
+        try:
+            for line in daemon.request('pull', all=all, verbose=verbose):
+                print(line)
+            return
+        except daemon.DaemonNotRunningError:
+            print('[No daemon] `cnavi serve` is not running, pulling '
+                  + 'without it')
+
+    from task_manager import TaskManager
+    tm = TaskManager(all=all, verbose=verbose, debug=debug, parser=parser,
+                     stream=stream, jobs=jobs, lecture_jobs=lecture_jobs,
+                     verify_lectures=verify_lectures,
+                     parse_workers=parse_workers,
+                     fresh_login=fresh_login, root=output,
+                     download_jobs=download_jobs,
+                     bandwidth=limit_rate * 1024 if limit_rate else None,
+                     cache=cache, proxy=proxy, insecure=insecure, rate=rate,
+                     retries=retries, timeout=timeout, profile=profile,
+                     profile_format=profile_format, favorites=favorites,
+                     newest_first=newest_first, output_format=output_format)
+    # Keep stdout for the records
+    logs = (redirect_stdout(sys.stderr) if output_format == 'jsonl'
+            else nullcontext())
+    with logs:
+        try:
+            tm.pull()
+        except KeyboardInterrupt:
+            tm.cancel()
+            print('[Interrupted] Progress was saved; run `cnavi pull` again '
+                  + 'to resume')
+        finally:
+            tm.close()
+
+
+@main.command(help='List your courses on CourseNavi')
+def courses():
+    import daemon
+    try:
+        for line in daemon.request('courses'):
+            print(line)
+        return
+    except daemon.DaemonNotRunningError:
+        pass
+
+    from task_manager import TaskManager
+    tm = TaskManager()
+    try:
+        tm.list_courses()
+    finally:
+        tm.close()
+
+
+@main.command(help='List the courses indexed by the last pull, or the '
+                   + 'lectures and files of COURSE (an ID or the start of '
+                   + 'a title)')
+@click.argument('course', required=False)
+@click.option('-o', '--output', default=DEFAULT_ROOT, show_default=True,
+              type=click.Path(file_okay=False),
+              help='Directory files were pulled into')
+def ls(course, output):
+    index = _open_index(output)
+    if index is None:
+        return
+    try:
+        if course is None:
+            for row in index.courses():
+                print(f'{row["title"]} ({row["community_id"]}, '
+                      + f'{row["lectures"]} lectures, '
+                      + f'{row["attachments"]} files)')
+            return
+
+        lectures = index.lectures(course)
+        if lectures is None:
+            print(f'[Not found] No indexed course matches {course!r}')
+            return
+        for lecture, attachments in lectures:
+            print(f'> {lecture["title"]}')
+            for attachment in attachments:
+                print(f' > {attachment["name"]}: {attachment["path"]}')
+    finally:
+        index.close()
+
+
+@main.command(help='Search the titles of the courses and lectures and the '
+                   + 'file names indexed by the last pull')
+@click.argument('query', nargs=-1, required=True)
+@click.option('-n', '--limit', type=click.IntRange(min=1), default=20,
+              show_default=True, help='Largest number of results')
+@click.option('-o', '--output', default=DEFAULT_ROOT, show_default=True,
+              type=click.Path(file_okay=False),
+              help='Directory files were pulled into')
+def search(query, limit, output):
+    index = _open_index(output)
+    if index is None:
+        return
+    try:
+        for row in index.search(' '.join(query), limit):
+            print(' > '.join(part for part in (row['course'],
+                                               row['lecture'],
+                                               row['name']) if part))
+    finally:
+        index.close()
+
+
+def _open_index(root):
+    """Return the index of root, or None after saying there is none."""
+    from index import Index, index_path
+    index = Index.open_existing(index_path(root))
+    if index is None:
+        print('[No index] Nothing was pulled yet; run `cnavi pull` first')
+    return index
+
+
+@main.command(help='Keep a logged-in session and run `cnavi pull -D` and '
+                   + '`cnavi courses` for other processes')
+@click.option('-p', '--parser', type=click.Choice(PARSERS),
+              default='html5lib',
+              help='HTML parser backend (falls back to html5lib on error)')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of logged-in sessions crawling courses at once')
+@click.option('-l', '--lecture-jobs', type=click.IntRange(min=1), default=1,
+              help='Number of lectures fetched at once within a course')
+@click.option('-o', '--output', default=DEFAULT_ROOT, show_default=True,
+              type=click.Path(file_okay=False),
+              help='Directory to download files into')
+@click.option('--download-jobs', type=click.IntRange(min=1), default=4,
+              help='Number of files downloaded at once')
+@click.option('--proxy', envvar='CNAVI_PROXY',
+              help='Proxy URL for all traffic, e.g. socks5://localhost:8080')
+@click.option('-k', '--insecure', is_flag=True,
+              help='Do not verify TLS certificates, e.g. behind a proxy '
+                   + 'that inspects traffic')
+@click.option('--stop', is_flag=True, help='Stop the running daemon')
+def serve(parser, jobs, lecture_jobs, output, download_jobs, proxy, insecure,
+          stop):
+    import daemon
+    if stop:
+        try:
+            for line in daemon.request('stop'):
+                print(line)
+        except daemon.DaemonNotRunningError:
+            print('`cnavi serve` is not running')
+        return
+
+    from task_manager import TaskManager
+    tm = TaskManager(parser=parser, jobs=jobs, lecture_jobs=lecture_jobs,
+                     root=output, download_jobs=download_jobs, proxy=proxy,
+                     insecure=insecure, session_path=daemon.SESSION_PATH)
+    try:
+        server = daemon.Daemon(tm)
+    except daemon.DaemonRunningError:
+        tm.close()
+        print('`cnavi serve` is already running')
+        return
+
+    print(f'Serving on {server.path}')
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
 
 
 @main.command(help='Set your CourseNavi credentials')
@@ -26,6 +263,7 @@ def pull(all, verbose, debug):
 @click.option('--password', prompt=True, hide_input=True,
               help='Your CourseNavi password')
 def config(email, password):
+    import keyring
     try:
         keyring.set_password('cnavi-cli-email', 'cnaviauth', email)
         keyring.set_password('cnavi-cli-password', 'cnaviauth', password)
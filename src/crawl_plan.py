@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+
+
+# Kinds of tasks, each made of tasks of the next kind
+KINDS = ('dashboard', 'course', 'lecture', 'attachment')
+
+# Seconds after which an unfinished plan is not resumed but started over,
+# since what it lists may have changed on CourseN@vi since
+MAX_AGE = 24 * 60 * 60
+
+# Seconds between checkpoints while a pull runs
+CHECKPOINT_INTERVAL = 2.0
+
+
+class Task:
+    """A step of a pull: visiting the dashboard, a course or a lecture, or
+    syncing an attachment.
+
+    A task is done once everything below it is, e.g. a lecture once all of
+    its attachments are synced.
+    """
+    __slots__ = ('kind', 'id', 'title', 'priority', 'done')
+
+    def __init__(self, kind, id, title, priority=()):
+        """kind     -- one of `KINDS`
+        id       -- key identifying the task across runs
+        title    -- what the task is about, for logs
+        priority -- sort key; tasks with a lower one run first
+        """
+        self.kind = kind
+        self.id = id
+        self.title = title
+        self.priority = priority
+        self.done = False
+
+    def __repr__(self):
+        return f'Task({self.kind!r}, {self.title!r})'
+
+
+class CrawlPlan:
+    """The tasks of a pull and which of them are done, checkpointed to disk.
+
+    Tasks are added as the pages listing them are visited, so a plan only
+    grows as far as the crawl got. Done tasks are saved, so a run
+    interrupted by an error, a timeout or Ctrl-C is resumed by the next
+    one, which skips them and starts at the first unfinished task. The plan
+    is discarded once a run completes.
+    """
+
+    def __init__(self, path, all=False):
+        """path -- JSON file the plan is checkpointed to
+        all  -- the plan is for a pull of every file (`pull --all`); a plan
+                is only resumed by a run of the same kind
+        """
+        self.path = path
+        self.all = all
+        self.tasks = {}
+        self.resumed = False
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._saved_at = time.monotonic()
+
+        saved = self._load()
+        if saved is not None:
+            self.resumed = bool(saved['done'])
+            self.created_at = saved['created_at']
+            self._done = set(saved['done'])
+        else:
+            self.created_at = time.time()
+            self._done = set()
+
+    def task(self, kind, id, title, priority=()):
+        """Return the task with an id, adding it to the plan if it is new.
+
+        Its state is restored from the checkpoint.
+        """
+        id = f'{kind}:{id}'
+        with self._lock:
+            task = self.tasks.get(id)
+            if task is None:
+                task = self.tasks[id] = Task(kind, id, title, priority)
+                task.done = id in self._done
+            return task
+
+    def pending(self, tasks):
+        """Return the tasks that still have to run, in order of priority."""
+        return sorted((task for task in tasks if not task.done),
+                      key=lambda task: task.priority)
+
+    def finish(self, task):
+        """Mark a task as done."""
+        with self._lock:
+            task.done = True
+            self._done.add(task.id)
+
+    def cancel(self):
+        """Cancel the run.
+
+        Running tasks finish but no new ones start; the plan is kept for the
+        next run to resume.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        """True if the whole run was cancelled."""
+        return self._cancelled.is_set()
+
+    def due(self):
+        """Return True if it is time for a checkpoint, i.e. for `save()`."""
+        return time.monotonic() - self._saved_at >= CHECKPOINT_INTERVAL
+
+    def save(self):
+        """Write the done tasks to disk."""
+        with self._lock:
+            saved = {
+                'all': self.all,
+                'created_at': self.created_at,
+                'done': sorted(self._done),
+            }
+            self._saved_at = time.monotonic()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def complete(self):
+        """Discard the plan after a run completed."""
+        with self._lock:
+            self.tasks.clear()
+            self._done.clear()
+            self.created_at = time.time()
+        self.resumed = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self):
+        """Return the saved plan if it can be resumed, or None."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if (saved.get('all') != self.all
+                or time.time() - saved.get('created_at', 0) > MAX_AGE):
+            return None
+        return saved
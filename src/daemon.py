@@ -0,0 +1,198 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from session_cache import CNAVI_DIR
+
+
+SOCKET_PATH = os.path.join(CNAVI_DIR, 'daemon.sock')
+
+# Saved session of the daemon. Other commands resume ~/.cnavi/session, and
+# two processes must never drive the same server-side session.
+SESSION_PATH = os.path.join(CNAVI_DIR, 'daemon-session')
+
+# Sessions are refreshed once this fraction of `hidSessionTimeOut` passed
+REFRESH_AFTER = 0.8
+
+# Session timeout assumed when the dashboard does not announce one, in s
+DEFAULT_TIMEOUT = 10 * 60
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-running owner of a logged-in TaskManager.
+
+    Other cnavi processes send commands over a Unix socket (see `request()`)
+    and get their output streamed back, so they skip startup, keyring
+    lookups and logging in. The primary session's dashboard is reloaded
+    before `hidSessionTimeOut` runs out, so the session never expires.
+    Commands are run one at a time.
+
+    Protocol: the client sends one JSON object with a 'command' and its
+    options on a single line; the daemon writes the command's output and
+    closes the connection.
+    """
+    daemon_threads = True
+
+    def __init__(self, task_manager, path=SOCKET_PATH):
+        """task_manager -- TaskManager to run commands with
+        path         -- Unix socket to listen on
+        """
+        self.task_manager = task_manager
+        self.path = path
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        _remove_stale_socket(path)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        # Whoever can connect can use the session, so only the owner may,
+        # from the moment the socket is bound
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(umask)
+
+    def serve(self):
+        """Login, then serve commands until stopped.
+
+        Return False if logging in failed.
+        """
+        with self.lock:
+            if self.task_manager.login() is None:
+                self._close()
+                return False
+
+        threading.Thread(target=self._keep_alive, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self._close()
+        return True
+
+    def stop(self):
+        """Stop serving once the current command finished."""
+        self.stopped.set()
+        threading.Thread(target=self.shutdown).start()
+
+    def run(self, command, options):
+        """Run a command and print its output."""
+        task_manager = self.task_manager
+        if command == 'ping':
+            print('pong')
+        elif command == 'pull':
+            task_manager.files.all = options.get('all', False)
+            task_manager.verbose = options.get('verbose', False)
+            task_manager.pull()
+        elif command == 'courses':
+            task_manager.list_courses()
+        elif command == 'stop':
+            print('Stopping cnavi serve')
+            self.stop()
+        else:
+            print(f'[Error] Unknown command: {command}')
+
+    def _keep_alive(self):
+        while not self.stopped.wait(self._refresh_interval()):
+            with self.lock:
+                try:
+                    self.task_manager.refresh()
+                except Exception as e:
+                    # The next command logs in again
+                    self.task_manager.primary = None
+                    print(f'[Refresh error] {e!r}')
+
+    def _refresh_interval(self):
+        primary = self.task_manager.primary
+        timeout = primary.dashboard.session_timeout() if primary else None
+        return (timeout or DEFAULT_TIMEOUT) * REFRESH_AFTER
+
+    def _close(self):
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.task_manager.close()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            options = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        command = options.pop('command', None)
+
+        output = io.TextIOWrapper(self.wfile, encoding='utf-8',
+                                  line_buffering=True)
+        try:
+            with self.server.lock, contextlib.redirect_stdout(output):
+                try:
+                    self.server.run(command, options)
+                except BrokenPipeError:
+                    raise
+                except Exception as e:
+                    print(f'[Error] {e!r}')
+        except BrokenPipeError:
+            # The client went away; nothing left to tell it
+            pass
+        finally:
+            try:
+                output.flush()
+            except BrokenPipeError:
+                pass
+            output.detach()
+
+
+def request(command, path=SOCKET_PATH, **options):
+    """Send a command to a running daemon and yield its output line by line.
+
+    Raise DaemonNotRunningError if no daemon listens on path.
+
+    command -- 'pull', 'courses', 'ping' or 'stop'
+    path    -- Unix socket of the daemon
+    options -- options of the command, e.g. all=True for 'pull'
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        raise DaemonNotRunningError(f'No cnavi daemon listening on {path}')
+
+    with sock, sock.makefile('r', encoding='utf-8') as lines:
+        message = json.dumps(dict(options, command=command)) + '\n'
+        sock.sendall(message.encode('utf-8'))
+        for line in lines:
+            yield line.rstrip('\n')
+
+
+def is_running(path=SOCKET_PATH):
+    """Return True if a daemon listens on path."""
+    try:
+        return list(request('ping', path)) == ['pong']
+    except DaemonNotRunningError:
+        return False
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a daemon that did not stop cleanly."""
+    if not os.path.exists(path):
+        return
+    if is_running(path):
+        raise DaemonRunningError(f'A cnavi daemon already listens on {path}')
+    os.remove(path)
+
+
+# ---- Custom Errors ----
+
+class DaemonNotRunningError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class DaemonRunningError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
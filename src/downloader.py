@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+import time
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BandwidthLimiter:
+    """Token bucket capping the combined throughput of every download."""
+
+    def __init__(self, rate):
+        """rate -- maximum bytes per second"""
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Block until `amount` bytes may be transferred."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate,
+                              self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Download:
+    """Result of a finished download."""
+
+    def __init__(self, sha256, size, etag, last_modified):
+        self.sha256 = sha256
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class Downloader:
+    """Streaming, resumable downloads run by a bounded pool of threads.
+
+    Responses are written to disk chunk by chunk and hashed on the way, so
+    a file is never held in memory. An interrupted download leaves its
+    partial file behind together with the response's validator, and the
+    next attempt asks only for the missing bytes with an HTTP Range request
+    guarded by If-Range.
+    """
+
+    def __init__(self, max_workers=4, bandwidth=None, chunk_size=CHUNK_SIZE):
+        """max_workers -- number of downloads running at once
+        bandwidth   -- combined limit of all downloads in bytes per second
+        chunk_size  -- number of bytes read at a time
+        """
+        self.chunk_size = chunk_size
+        self.limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, func, *args):
+        """Run func(*args) in the pool and return its future."""
+        return self.executor.submit(func, *args)
+
+    def shutdown(self, cancel=False):
+        """Wait for running downloads and release the pool.
+
+        cancel -- drop the downloads that have not started yet
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def download(self, fetch, url, part_path, headers=None):
+        """Stream a URL into part_path, resuming a previous partial download.
+
+        Return a Download, or None if the server answered 304 Not Modified.
+
+        fetch     -- callable taking (url, headers) and returning a streamed
+                     requests.Response
+        url       -- URL to download
+        part_path -- file to write to
+        headers   -- extra request headers (e.g. conditional headers)
+        """
+        headers = dict(headers or {})
+        validator_path = part_path + '.validator'
+        offset = self._resumable_size(part_path, validator_path)
+        if offset:
+            with open(validator_path, encoding='utf-8') as f:
+                headers['Range'] = f'bytes={offset}-'
+                headers['If-Range'] = f.read()
+
+        with fetch(url, headers) as response:
+            if response.status_code == 304:
+                return None
+            if response.status_code == 416 and offset:
+                # The partial file is no longer valid for this resource
+                self._discard(part_path, validator_path)
+                headers.pop('Range')
+                headers.pop('If-Range')
+                return self.download(fetch, url, part_path, headers)
+            response.raise_for_status()
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            resumed = (response.status_code == 206
+                       and _range_start(response) == offset)
+            if not resumed:
+                offset = 0
+
+            sha256 = hashlib.sha256()
+            if resumed:
+                self._hash_file(part_path, sha256)
+            else:
+                self._save_validator(validator_path, etag or last_modified)
+
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                size = offset
+                for chunk in response.iter_content(self.chunk_size):
+                    if self.limiter:
+                        self.limiter.consume(len(chunk))
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+
+        _remove(validator_path)
+        return Download(sha256.hexdigest(), size, etag, last_modified)
+
+    def _resumable_size(self, part_path, validator_path):
+        """Return the size of a partial download that can be resumed."""
+        if not os.path.exists(validator_path):
+            _remove(part_path)
+            return 0
+        try:
+            return os.path.getsize(part_path)
+        except OSError:
+            return 0
+
+    def _save_validator(self, validator_path, validator):
+        # Without a validator a partial file cannot be safely resumed
+        if validator is None:
+            _remove(validator_path)
+            return
+        os.makedirs(os.path.dirname(validator_path), exist_ok=True)
+        with open(validator_path, 'w', encoding='utf-8') as f:
+            f.write(validator)
+
+    def _hash_file(self, path, sha256):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                sha256.update(chunk)
+
+    def _discard(self, part_path, validator_path):
+        _remove(part_path)
+        _remove(validator_path)
+
+
+def _range_start(response):
+    """Return the first byte position of a 206 response's Content-Range."""
+    content_range = response.headers.get('Content-Range', '')
+    try:
+        return int(content_range.split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,45 @@
+import codecs
+from html.parser import HTMLParser
+
+
+class PageExtractor(HTMLParser):
+    """Incremental extractor of the form fields of CourseN@vi pages.
+
+    HTML is fed in chunks as it arrives and the name and value of every named
+    element are collected into `fields`, so no tree of the page is ever
+    built.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.fields = {}
+        self.size = 0           # bytes fed by `extract_stream()`
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if 'name' in attrs:
+            self.fields.setdefault(attrs['name'], attrs.get('value'))
+
+
+def extract_stream(response, chunk_size):
+    """Feed a streamed response into a `PageExtractor` chunk by chunk.
+
+    Return the extractor once the whole body has been read, so that its
+    `fields` can be used as the page's form state.
+
+    response   -- a `requests.Response` made with `stream=True`
+    chunk_size -- number of bytes read per chunk
+    """
+    extractor = PageExtractor()
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(
+        errors='replace')
+    try:
+        for chunk in response.iter_content(chunk_size):
+            extractor.size += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+        extractor.feed(decoder.decode(b'', final=True))
+        extractor.close()
+    finally:
+        response.close()
+
+    return extractor
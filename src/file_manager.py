@@ -1,4 +1,176 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from downloader import Downloader
+from settings import DEFAULT_ROOT
+
+
 class FileManager:
-    def __init__(self):
-        pass
+    """Local copies of attachments and the manifest that describes them.
+
+    Files are laid out as <root>/<course>/<lecture>/<file name>. Their
+    contents are stored once under <root>/.cnavi/objects by SHA-256 and
+    hard linked into place, so a file attached to several courses takes up
+    space once. Downloads stream straight to disk and resume from partial
+    files under <root>/.cnavi/partial. The manifest (<root>/.cnavi/manifest.json) records for each
+    local file its course, lecture, URL, size, ETag, Last-Modified and hash,
+    so unchanged files are not transferred again.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, all=False, downloader=None):
+        """root       -- directory to download files into
+        all        -- download every file, not just the ones that are new or
+                      changed
+        downloader -- Downloader to run downloads with
+        """
+        self.root = root
+        self.all = all
+        self.downloader = downloader or Downloader()
+        self.meta_dir = os.path.join(root, '.cnavi')
+        self.objects_dir = os.path.join(self.meta_dir, 'objects')
+        self.partial_dir = os.path.join(self.meta_dir, 'partial')
+        self.manifest_path = os.path.join(self.meta_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+        self._lock = threading.Lock()
+
+    def sync(self, fetch, url, name, course, lecture):
+        """Download an attachment if it is new or changed.
+
+        Return True if the file was downloaded, False if the local copy is
+        up to date. A conditional GET is made with the validators recorded
+        in the manifest, so an unchanged file costs one empty response.
+
+        fetch   -- callable taking (url, headers) and returning a streamed
+                   requests.Response, e.g.
+                   CourseNaviInterface.fetch_attachment
+        url     -- URL of the attachment, which identifies it remotely
+        name    -- file name of the attachment
+        course  -- title of the course the attachment belongs to
+        lecture -- title of the lecture the attachment belongs to
+        """
+        key = self.key(name, course, lecture)
+        path = os.path.join(self.root, key)
+        with self._lock:
+            entry = self.manifest.get(key)
+        if entry and entry['url'] != url:
+            entry = None
+
+        part_path = os.path.join(self.partial_dir,
+                                 hashlib.sha1(key.encode()).hexdigest())
+        headers = {}
+        if (entry and not self.all and os.path.exists(path)
+                and not os.path.exists(part_path)):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        download = self.downloader.download(fetch, url, part_path, headers)
+        if download is None:
+            return False
+
+        if (entry and not self.all and entry['sha256'] == download.sha256
+                and os.path.exists(path)):
+            os.remove(part_path)
+            self._record(key, entry, download)
+            return False
+
+        self._store(download.sha256, part_path)
+        self._link(download.sha256, path)
+        self._record(key, {
+            'course': course,
+            'lecture': lecture,
+            'url': url,
+            'size': download.size,
+            'sha256': download.sha256,
+        }, download)
+        return True
+
+    def key(self, name, course, lecture):
+        """Return the path of an attachment relative to the root, which is
+        also its key in the manifest.
+        """
+        return os.path.join(_safe_name(course),
+                            _safe_name(lecture),
+                            _safe_name(name))
+
+    def submit(self, fetch, url, name, course, lecture):
+        """Like `sync()`, but run in the downloader's pool.
+
+        Return a future of the result of `sync()`.
+        """
+        return self.downloader.submit(self.sync, fetch, url, name,
+                                      course, lecture)
+
+    def save(self):
+        """Write the manifest to disk."""
+        with self._lock:
+            manifest = dict(self.manifest)
+
+        os.makedirs(self.meta_dir, exist_ok=True)
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def reload(self):
+        """Read the manifest again from disk."""
+        manifest = self._load_manifest()
+        with self._lock:
+            self.manifest = manifest
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _record(self, key, entry, download):
+        entry = dict(entry,
+                     etag=download.etag,
+                     last_modified=download.last_modified)
+        with self._lock:
+            self.manifest[key] = entry
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _store(self, digest, part_path):
+        """Move a downloaded file under its hash unless it is already
+        stored.
+        """
+        object_path = self._object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(part_path)
+            return
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(part_path, object_path)
+
+    def _link(self, digest, path):
+        """Put the stored object with a given hash at path."""
+        object_path = self._object_path(digest)
+        if os.path.exists(path) and os.path.samefile(object_path, path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.link(object_path, tmp)
+        except OSError:
+            # Hard links are not supported across devices or on every
+            # file system
+            shutil.copyfile(object_path, tmp)
+        os.replace(tmp, path)
+
 
+def _safe_name(name):
+    """Return name with characters that are unsafe in file names replaced."""
+    name = name.replace(os.sep, '_').replace('\0', '').strip()
+    if os.altsep:
+        name = name.replace(os.altsep, '_')
+    return name if name not in ('', '.', '..') else '_'
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class Fingerprints:
+    """Fingerprints of the lectures that were pulled completely.
+
+    For each course (keyed by its `hidCommunityId`), records the fingerprint
+    of every lecture whose attachments were all synced and of the course's
+    whole lecture listing, so an unchanged course or lecture does not have
+    to be fetched again.
+    """
+
+    def __init__(self, path):
+        """path -- JSON file the fingerprints are kept in"""
+        self.path = path
+        self.courses = self._load()
+        self._lock = threading.Lock()
+
+    def is_unchanged(self, course, listing):
+        """Return True if a course's listing is the one last pulled.
+
+        course  -- key of the course
+        listing -- fingerprint of its listing, see `listing_fingerprint()`
+        """
+        with self._lock:
+            entry = self.courses.get(course)
+        return entry is not None and entry['listing'] == listing
+
+    def has_lecture(self, course, lecture):
+        """Return True if a lecture was pulled as it is now.
+
+        course  -- key of the course
+        lecture -- fingerprint of the lecture (`Lecture.fingerprint`)
+        """
+        with self._lock:
+            entry = self.courses.get(course)
+        return entry is not None and lecture in entry['lectures']
+
+    def update(self, course, listing, lectures):
+        """Record a course as pulled.
+
+        course   -- key of the course
+        listing  -- fingerprint of its listing
+        lectures -- fingerprints of its lectures
+        """
+        with self._lock:
+            self.courses[course] = {
+                'listing': listing,
+                'lectures': sorted(set(lectures)),
+            }
+
+    def reload(self):
+        """Read the fingerprints again from disk."""
+        courses = self._load()
+        with self._lock:
+            self.courses = courses
+
+    def save(self):
+        """Write the fingerprints to disk."""
+        with self._lock:
+            courses = dict(self.courses)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(courses, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+def listing_fingerprint(lectures):
+    """Return the fingerprint of a course's listing of Lectures."""
+    digest = hashlib.sha1()
+    for lecture in lectures:
+        digest.update(lecture.fingerprint.encode('ascii'))
+    return digest.hexdigest()
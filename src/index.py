@@ -0,0 +1,312 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS courses (
+    community_id TEXT PRIMARY KEY,  -- hidCommunityId
+    folder_id TEXT,                 -- folder_id[]
+    title TEXT NOT NULL,
+    position INTEGER                -- index on the dashboard
+);
+CREATE TABLE IF NOT EXISTS lectures (
+    id INTEGER PRIMARY KEY,
+    community_id TEXT NOT NULL REFERENCES courses ON DELETE CASCADE,
+    lecture_key TEXT NOT NULL,      -- hidAdmKey02
+    title TEXT NOT NULL,
+    position INTEGER,               -- index on the course detail
+    fingerprint TEXT,
+    ad_hoc_fields TEXT,             -- JSON of Lecture.ad_hoc_fields
+    UNIQUE (community_id, lecture_key)
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    lecture_id INTEGER NOT NULL REFERENCES lectures ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT                       -- local copy, relative to the root
+);
+CREATE INDEX IF NOT EXISTS attachments_lecture ON attachments (lecture_id);
+'''
+
+# One row per course, lecture and attachment. The trigram tokenizer matches
+# any substring of 3 or more characters, which suits Japanese titles that
+# have no spaces between words.
+SEARCH_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+    kind UNINDEXED, community_id UNINDEXED, lecture_id UNINDEXED,
+    course, lecture, name,
+    tokenize = 'trigram'
+);
+'''
+
+# The same rows without full-text search, for SQLite builds older than 3.34
+# or without FTS5, which are searched by a scan
+PLAIN_SEARCH_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS search (
+    kind TEXT, community_id TEXT, lecture_id INTEGER,
+    course TEXT, lecture TEXT, name TEXT
+);
+'''
+
+# Shortest term the trigram tokenizer can match
+MIN_MATCH = 3
+
+
+class Index:
+    """Local SQLite index of the courses, lectures and attachments pulled.
+
+    Lets `cnavi ls` and `cnavi search` answer without logging in. It is
+    updated course by course as a pull goes, so it reflects the last pull
+    of each course.
+    """
+
+    def __init__(self, path):
+        """path -- SQLite database the index is kept in, see `index_path()`
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Courses are pulled in several threads; the lock serializes them
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(SCHEMA)
+        self._db.executescript(SEARCH_SCHEMA if has_trigram()
+                               else PLAIN_SEARCH_SCHEMA)
+        # Whether `search` is a trigram full-text table, which an index made
+        # by an older SQLite is not
+        self.full_text = 'fts5' in self._db.execute(
+            'SELECT sql FROM sqlite_master WHERE name = \'search\''
+        ).fetchone()[0].lower()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open_existing(cls, path):
+        """Return the index at path, or None if nothing was pulled yet."""
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def update_course(self, position, course, lectures, attachments):
+        """Record a course as just pulled.
+
+        Lectures no longer listed are dropped. Attachments are replaced only
+        for the lectures in attachments, so the files of unchanged lectures,
+        which were not visited, are kept.
+
+        position    -- index of the course on the dashboard
+        course      -- Course
+        lectures    -- every Lecture listed on the course detail
+        attachments -- dict mapping the `hidAdmKey02` of each visited lecture
+                       to a list of its (name, url, path) tuples
+        """
+        community_id = course.ad_hoc_fields['hidCommunityId']
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT INTO courses (community_id, folder_id, title, position)'
+                + ' VALUES (?, ?, ?, ?) ON CONFLICT (community_id) DO UPDATE'
+                + ' SET folder_id = excluded.folder_id,'
+                + ' title = excluded.title, position = excluded.position',
+                (community_id, course.fields['folder_id[]'], course.title,
+                 position))
+
+            keys = []
+            for lecture_position, lecture in enumerate(lectures):
+                key = lecture.ad_hoc_fields['hidAdmKey02']
+                keys.append(key)
+                self._db.execute(
+                    'INSERT INTO lectures (community_id, lecture_key, title,'
+                    + ' position, fingerprint, ad_hoc_fields)'
+                    + ' VALUES (?, ?, ?, ?, ?, ?)'
+                    + ' ON CONFLICT (community_id, lecture_key) DO UPDATE'
+                    + ' SET title = excluded.title,'
+                    + ' position = excluded.position,'
+                    + ' fingerprint = excluded.fingerprint,'
+                    + ' ad_hoc_fields = excluded.ad_hoc_fields',
+                    (community_id, key, lecture.title, lecture_position,
+                     lecture.fingerprint,
+                     json.dumps(lecture.ad_hoc_fields, sort_keys=True)))
+
+            self._db.execute(
+                'DELETE FROM lectures WHERE community_id = ?'
+                + ' AND lecture_key NOT IN (SELECT value FROM json_each(?))',
+                (community_id, json.dumps(keys)))
+
+            for key, files in attachments.items():
+                lecture_id = self._db.execute(
+                    'SELECT id FROM lectures'
+                    + ' WHERE community_id = ? AND lecture_key = ?',
+                    (community_id, key)).fetchone()[0]
+                self._db.execute('DELETE FROM attachments'
+                                 + ' WHERE lecture_id = ?', (lecture_id,))
+                self._db.executemany(
+                    'INSERT INTO attachments (lecture_id, name, url, path)'
+                    + ' VALUES (?, ?, ?, ?)',
+                    [(lecture_id, *file) for file in files])
+
+            self._reindex(community_id)
+
+    def prune_courses(self, community_ids):
+        """Drop the courses that are no longer on the dashboard.
+
+        community_ids -- `hidCommunityId` of every course on the dashboard
+        """
+        with self._lock, self._db:
+            gone = [row[0] for row in self._db.execute(
+                'SELECT community_id FROM courses'
+                + ' WHERE community_id NOT IN (SELECT value FROM json_each(?))',
+                (json.dumps(list(community_ids)),))]
+            for community_id in gone:
+                self._db.execute('DELETE FROM courses WHERE community_id = ?',
+                                 (community_id,))
+                self._db.execute('DELETE FROM search WHERE community_id = ?',
+                                 (community_id,))
+
+    def courses(self):
+        """Return the indexed courses in dashboard order.
+
+        Return a list of rows with: community_id, folder_id, title, lectures
+        (their number) and attachments (their number).
+        """
+        with self._lock:
+            return self._db.execute(
+                'SELECT c.community_id, c.folder_id, c.title,'
+                + ' COUNT(DISTINCT l.id) AS lectures,'
+                + ' COUNT(a.rowid) AS attachments'
+                + ' FROM courses c'
+                + ' LEFT JOIN lectures l USING (community_id)'
+                + ' LEFT JOIN attachments a ON a.lecture_id = l.id'
+                + ' GROUP BY c.community_id ORDER BY c.position').fetchall()
+
+    def lectures(self, course):
+        """Return the lectures of a course with their attachments.
+
+        Return a list of (lecture row, list of attachment rows) in the order
+        of the course detail, or None if no course matches.
+
+        course -- `hidCommunityId` or title of the course, or a prefix of its
+                  title
+        """
+        with self._lock:
+            match = self._db.execute(
+                'SELECT community_id FROM courses'
+                + ' WHERE community_id = ? OR title = ?'
+                + ' OR title LIKE ? ESCAPE \'\\\' ORDER BY position LIMIT 1',
+                (course, course, _escape_like(course) + '%')).fetchone()
+            if match is None:
+                return None
+
+            lectures = self._db.execute(
+                'SELECT * FROM lectures WHERE community_id = ?'
+                + ' ORDER BY position', (match[0],)).fetchall()
+            attachments = {}
+            for row in self._db.execute(
+                    'SELECT a.* FROM attachments a'
+                    + ' JOIN lectures l ON a.lecture_id = l.id'
+                    + ' WHERE l.community_id = ? ORDER BY a.rowid',
+                    (match[0],)):
+                attachments.setdefault(row['lecture_id'], []).append(row)
+        return [(lecture, attachments.get(lecture['id'], []))
+                for lecture in lectures]
+
+    def search(self, query, limit=20):
+        """Return the courses, lectures and attachments matching a query.
+
+        Every whitespace-separated term of the query must appear in the
+        course title, lecture title or file name. Return a list of rows with:
+        kind ('course', 'lecture' or 'attachment'), course, lecture, name,
+        best matches first.
+
+        query -- search terms
+        limit -- largest number of results
+        """
+        terms = query.split()
+        if not terms:
+            return []
+
+        # Trigrams cannot match shorter terms, which are looked up by a scan
+        # like every term without full-text search
+        long_terms = [term for term in terms
+                      if self.full_text and len(term) >= MIN_MATCH]
+        short_terms = [term for term in terms if term not in long_terms]
+
+        where = []
+        params = []
+        if long_terms:
+            where.append('search MATCH ?')
+            params.append(' '.join('"' + term.replace('"', '""') + '"'
+                                   for term in long_terms))
+        for term in short_terms:
+            where.append('(course LIKE ? ESCAPE \'\\\''
+                         + ' OR lecture LIKE ? ESCAPE \'\\\''
+                         + ' OR name LIKE ? ESCAPE \'\\\')')
+            params.extend(['%' + _escape_like(term) + '%'] * 3)
+
+        order = 'rank' if long_terms else 'rowid'
+        with self._lock:
+            return self._db.execute(
+                'SELECT kind, course, lecture, name FROM search'
+                + ' WHERE ' + ' AND '.join(where)
+                + f' ORDER BY {order} LIMIT ?',
+                params + [limit]).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _reindex(self, community_id):
+        """Rebuild the search rows of a course from its tables."""
+        self._db.execute('DELETE FROM search WHERE community_id = ?',
+                         (community_id,))
+        self._db.execute(
+            'INSERT INTO search (kind, community_id, course)'
+            + ' SELECT \'course\', community_id, title FROM courses'
+            + ' WHERE community_id = ?', (community_id,))
+        self._db.execute(
+            'INSERT INTO search (kind, community_id, lecture_id, course,'
+            + ' lecture)'
+            + ' SELECT \'lecture\', c.community_id, l.id, c.title, l.title'
+            + ' FROM lectures l JOIN courses c USING (community_id)'
+            + ' WHERE c.community_id = ?', (community_id,))
+        self._db.execute(
+            'INSERT INTO search (kind, community_id, lecture_id, course,'
+            + ' lecture, name)'
+            + ' SELECT \'attachment\', c.community_id, l.id, c.title,'
+            + ' l.title, a.name'
+            + ' FROM attachments a JOIN lectures l ON a.lecture_id = l.id'
+            + ' JOIN courses c USING (community_id)'
+            + ' WHERE c.community_id = ?', (community_id,))
+
+
+def has_trigram():
+    """Return True if SQLite supports FTS5 with the trigram tokenizer
+    (SQLite >= 3.34 built with FTS5).
+    """
+    global _trigram
+    if _trigram is None:
+        db = sqlite3.connect(':memory:')
+        try:
+            db.execute('CREATE VIRTUAL TABLE t USING fts5 (x, '
+                       + 'tokenize = \'trigram\')')
+            _trigram = True
+        except sqlite3.OperationalError:
+            _trigram = False
+        finally:
+            db.close()
+    return _trigram
+
+
+_trigram = None
+
+
+def index_path(root):
+    """Return the path of the index of the files pulled into root."""
+    return os.path.join(root, '.cnavi', 'index.sqlite3')
+
+
+def _escape_like(text):
+    """Escape the wildcards of a LIKE pattern, with backslash as escape."""
+    return (text.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
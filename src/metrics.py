@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+# Phases a navigation step's time is split into:
+#   network -- sending the request and receiving the response (only its
+#              headers when streamed), including throttling and retries
+#   stream  -- receiving a streamed body while extracting it
+#   cache   -- reading the response from the response cache
+#   parse   -- building the soup in `_soupify()`
+#   extract -- reading fields and rows out of the soup
+PHASES = ('network', 'stream', 'cache', 'parse', 'extract')
+
+
+class Metrics:
+    """Timings and sizes of every request and the work done on its page.
+
+    Each event is a (step, phase, seconds, size) tuple, where step names the
+    navigation step (e.g. 'course_detail') and phase is one of `PHASES`.
+    Events are aggregated per step and passed to every hook as they happen,
+    so they can be exported to an external metrics system.
+    """
+
+    def __init__(self, hooks=None):
+        """hooks -- callables taking (step, phase, seconds, size)"""
+        self.hooks = list(hooks or [])
+        self.steps = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the events recorded so far and start a new run."""
+        with self._lock:
+            self.steps = {}
+            self.started_at = time.time()
+
+    def add_hook(self, hook):
+        """Call hook(step, phase, seconds, size) on every event."""
+        self.hooks.append(hook)
+
+    def record(self, step, phase, seconds, size=0):
+        """Record an event.
+
+        step    -- navigation step name
+        phase   -- one of `PHASES`
+        seconds -- time spent
+        size    -- bytes transferred, if any
+        """
+        with self._lock:
+            totals = self.steps.setdefault(step, _empty_totals())
+            totals[phase] += seconds
+            totals['bytes'] += size
+            if phase in ('network', 'cache'):
+                totals['requests'] += 1
+
+        for hook in self.hooks:
+            hook(step, phase, seconds, size)
+
+    @contextmanager
+    def time(self, step, phase):
+        """Record the time spent in a with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(step, phase, time.perf_counter() - start)
+
+    def summary(self):
+        """Return the per-step totals and the wall time of the run."""
+        with self._lock:
+            steps = {step: dict(totals) for step, totals in self.steps.items()}
+        return {
+            'wall_seconds': time.time() - self.started_at,
+            'steps': steps,
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_folded(self):
+        """Return the totals as folded stacks for flamegraph tools.
+
+        One line per step and phase, weighted in microseconds.
+        """
+        lines = []
+        for step, totals in sorted(self.summary()['steps'].items()):
+            for phase in PHASES:
+                if totals[phase]:
+                    lines.append(f'cnavi;{step};{phase} '
+                                 + f'{round(totals[phase] * 1e6)}')
+        return '\n'.join(lines) + '\n'
+
+    def format_table(self):
+        """Return the per-step totals as a human readable table."""
+        header = (f'{"step":<24}{"requests":>9}{"KiB":>9}'
+                  + ''.join(f'{phase + " s":>10}' for phase in PHASES))
+        lines = [header]
+        for step, totals in sorted(self.summary()['steps'].items()):
+            lines.append(f'{step:<24}{totals["requests"]:>9}'
+                         + f'{totals["bytes"] / 1024:>9.0f}'
+                         + ''.join(f'{totals[phase]:>10.3f}'
+                                   for phase in PHASES))
+        return '\n'.join(lines)
+
+
+def _empty_totals():
+    totals = dict.fromkeys(PHASES, 0.0)
+    totals['requests'] = 0
+    totals['bytes'] = 0
+    return totals
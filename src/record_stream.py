@@ -0,0 +1,75 @@
+import json
+import os
+import queue
+import sys
+import threading
+
+
+# Records waiting to be written before `RecordStream.emit()` blocks
+QUEUE_SIZE = 256
+
+_CLOSE = object()
+
+
+class RecordStream:
+    """JSON lines written to a stream as they are emitted.
+
+    Records are handed to a writer thread through a bounded queue, and each
+    line is flushed as soon as it is written, so a consumer reading a pipe
+    sees every record immediately. A consumer that reads slower than the
+    crawl fills the pipe and then the queue, after which `emit()` blocks,
+    slowing the crawl down to its pace. Once the consumer goes away
+    (`BrokenPipeError`), further records are dropped and `on_broken` is
+    called.
+    """
+
+    def __init__(self, stream=None, on_broken=None, maxsize=QUEUE_SIZE):
+        """stream    -- text stream to write to (defaults to sys.stdout)
+        on_broken -- callable called once the stream's reader went away
+        maxsize   -- records queued before `emit()` blocks
+        """
+        self.stream = stream or sys.stdout
+        self.on_broken = on_broken
+        self.broken = threading.Event()
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        """Queue a record for writing, blocking while the queue is full.
+
+        record -- dict serializable to JSON
+        """
+        if not self.broken.is_set():
+            self._queue.put(record)
+
+    def close(self):
+        """Write the queued records and stop the writer thread."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _write(self):
+        while True:
+            record = self._queue.get()
+            if record is _CLOSE:
+                return
+            if self.broken.is_set():
+                continue
+            try:
+                self.stream.write(json.dumps(record, ensure_ascii=False)
+                                  + '\n')
+                self.stream.flush()
+            except BrokenPipeError:
+                self._break()
+
+    def _break(self):
+        self.broken.set()
+        try:
+            # Python flushes stdout again on exit, which would fail too
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, self.stream.fileno())
+            os.close(devnull)
+        except (AttributeError, OSError, ValueError):
+            pass
+        if self.on_broken is not None:
+            self.on_broken()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from session_cache import CNAVI_DIR
+
+
+# Fields that change between sessions without changing the page requested
+VOLATILE_FIELDS = frozenset([
+    'SessionIdEncodeKey',
+    'hidSessionKey',
+    'hidPankuzuSessionKey',
+])
+
+
+class ResponseCache:
+    """On-disk cache of response bodies keyed on request fingerprints.
+
+    A fingerprint is the method, URL and the posted fields other than
+    `VOLATILE_FIELDS`, so the same navigation step hits the cache across
+    sessions, plus any server-side context the response depends on. Bodies
+    are stored zlib-compressed and only readable by their owner, expire
+    after `ttl` seconds and the least recently used ones are evicted once
+    the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024,
+                 ttl=24 * 60 * 60):
+        """path      -- cache directory (defaults to ~/.cnavi/responses)
+        max_bytes -- maximum size of the cache on disk
+        ttl       -- seconds before a cached response expires
+        """
+        self.path = path or os.path.join(CNAVI_DIR, 'responses')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._size = None
+
+    def fingerprint(self, method, url, params=None, context=None):
+        """Return the cache key of a request.
+
+        method  -- 'GET' or 'POST'
+        url     -- requested URL
+        params  -- posted form fields
+        context -- server-side state the response depends on besides the
+                   request, e.g. the hidCommunityId of the open course
+        """
+        fields = sorted((name, str(value))
+                        for name, value in (params or {}).items()
+                        if name not in VOLATILE_FIELDS)
+        request = json.dumps([method, url, fields, context],
+                             ensure_ascii=False)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached body for a key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                created_at, body = zlib.decompress(f.read()).split(b'\n', 1)
+        except (OSError, zlib.error, ValueError):
+            return None
+
+        if float(created_at) + self.ttl <= time.time():
+            self._discard(path)
+            return None
+
+        # The modification time tracks the last use for LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return body.decode('utf-8')
+
+    def put(self, key, body):
+        """Cache a response body under a key."""
+        path = self._entry_path(key)
+        data = zlib.compress(f'{time.time()}\n{body}'.encode('utf-8'))
+
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        # Pages show the account's name and courses, so only the owner may
+        # read them
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            size = self._current_size()
+            if os.path.exists(path):
+                size -= os.path.getsize(path)
+            os.replace(tmp, path)
+            self._size = size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            for path, _, _ in self._entries():
+                self._remove(path)
+            self._size = 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _entries(self):
+        """Yield (path, size, last used) of every cached response."""
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def _evict(self):
+        """Remove least recently used responses until the cache fits."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._remove(path)
+            self._size -= size
+
+    def _discard(self, path):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,64 @@
+import os
+import pickle
+import time
+
+
+CNAVI_DIR = os.path.join(os.path.expanduser('~'), '.cnavi')
+
+
+class SessionCache:
+    """A logged-in session persisted between runs.
+
+    Stores the session's cookie jar, the FormState fields of the last
+    dashboard and when the session expires, so a later run can resume the
+    session instead of logging in again. The file holds session cookies, so
+    it is only readable by its owner.
+    """
+
+    def __init__(self, path=None):
+        """path -- cache file (defaults to ~/.cnavi/session)"""
+        self.path = path or os.path.join(CNAVI_DIR, 'session')
+
+    def load(self):
+        """Return the saved session as a dictionary, or None if there is no
+        saved session or it has expired.
+
+        Keys: 'cookies', 'dashboard', 'expires_at'
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        expires_at = saved.get('expires_at')
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return saved
+
+    def save(self, cookies, dashboard, timeout=None):
+        """Save a session.
+
+        cookies   -- the session's cookie jar
+        dashboard -- FormState fields of the last dashboard
+        timeout   -- seconds of inactivity before the session expires
+        """
+        saved = {
+            'cookies': cookies,
+            'dashboard': dashboard,
+            'expires_at': time.time() + timeout if timeout else None,
+        }
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        tmp = self.path + '.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(saved, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """Forget the saved session."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+
+from api import FormState
+
+
+class Worker:
+    """A logged-in interface together with the dashboard it was served."""
+
+    def __init__(self, api, dashboard):
+        """api       -- logged-in CourseNaviInterface
+        dashboard -- dashboard returned by `api.login()`
+        """
+        self.api = api
+        self.dashboard = FormState.of(dashboard)
+        self.courses = api.get_courses(dashboard)
+
+    def find_course(self, index, title):
+        """Return this worker's own Course for one listed on the dashboard.
+
+        Courses carry session-specific parameters, so a course from another
+        worker's dashboard cannot be used. Dashboards list courses in the
+        same order, but fall back to matching the title just in case.
+        """
+        if index < len(self.courses) and self.courses[index].title == title:
+            return self.courses[index]
+        for course in self.courses:
+            if course.title == title:
+                return course
+        raise LookupError(f'Course not found on dashboard: {title}')
+
+
+class SessionPool:
+    """Pool of up to `size` independently logged-in workers.
+
+    CourseN@vi keeps navigation state (`ControllerParameters`,
+    `SessionIdEncodeKey`) per session, so a session must never be driven by
+    two threads at once. Each worker is handed to one job at a time and new
+    workers are logged in lazily until the pool is full.
+    """
+
+    def __init__(self, factory, size, primary=None):
+        """factory -- callable returning a new CourseNaviInterface
+        size    -- maximum number of workers
+        primary -- an already logged-in Worker to include in the pool
+        """
+        self.factory = factory
+        self.size = size
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._primary = primary
+
+        if primary is not None:
+            self._idle.put(primary)
+            self._created = 1
+
+    def map(self, func, items, cancel=None):
+        """Call `func(worker, item)` for every item across the pool.
+
+        Yield results as they complete. An exception raised by any job, or
+        KeyboardInterrupt, is re-raised here once the running jobs returned;
+        jobs not started yet are dropped.
+
+        cancel -- callable telling running jobs to return early, called
+                  before waiting for them when an exception is raised
+        """
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self._run, func, item)
+                       for item in items]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                if cancel is not None:
+                    cancel()
+                raise
+
+    def close(self):
+        """Close the connections of the workers logged in by the pool.
+
+        The primary worker is left open for its owner.
+        """
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not self._primary:
+                worker.api.close()
+
+    def _run(self, func, item):
+        worker = self._acquire()
+        try:
+            return func(worker, item)
+        finally:
+            self._idle.put(worker)
+
+    def _acquire(self):
+        with self._lock:
+            create = self._idle.empty() and self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+
+        try:
+            api = self.factory()
+            return Worker(api, api.login())
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
@@ -0,0 +1,13 @@
+"""Defaults shared by the CLI and the modules behind it.
+
+Kept free of third-party imports, so that the CLI can build its options
+without loading the parser and network stack.
+"""
+import os
+
+
+PARSERS = ('html5lib', 'lxml', 'html.parser')
+
+BASE_URL = 'https://cnavi.waseda.jp/index.php'
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), 'CourseNavi')
@@ -1,44 +1,494 @@
-from api import (CourseNaviInterface,
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+import functools
+import os
+import threading
+
+import requests
+
+from api import (BASE_URL,
+                 CourseNaviInterface,
                  InvalidCredentialsError,
                  NoCredentialsError)
+from downloader import Downloader
+from file_manager import DEFAULT_ROOT, FileManager
+from crawl_plan import CrawlPlan
+from fingerprints import Fingerprints, listing_fingerprint
+from index import Index, index_path
+from metrics import Metrics
+from record_stream import RecordStream
+from response_cache import ResponseCache
+from session_cache import SessionCache
+from session_pool import SessionPool, Worker
+from throttle import Throttle
+
+
+# Lectures fetched per batch, per lecture job
+LECTURE_BATCH = 4
 
 
 class TaskManager:
-    def __init__(self, all=False, verbose=False, debug=False):
-        self.api = CourseNaviInterface()
+    def __init__(self, all=False, verbose=False, debug=False,
+                 parser='html5lib', stream=False, jobs=1, lecture_jobs=1,
+                 fresh_login=False, root=DEFAULT_ROOT, download_jobs=4,
+                 bandwidth=None, cache=False, base_url=BASE_URL, proxy=None,
+                 rate=None, retries=3, timeout=30, parse_workers=0,
+                 profile=None, profile_format='json', favorites=(),
+                 newest_first=False, output_format='text', email=None,
+                 password=None, insecure=False, session_path=None,
+                 verify_lectures=False):
+        self.verbose = verbose
+        self.debug = debug
+        self.parser = parser
+        self.stream = stream
+        self.jobs = jobs
+        self.lecture_jobs = lecture_jobs
+        # Lectures fetched concurrently are fetched again one at a time and
+        # compared, see `CourseNaviInterface.select_lectures()`
+        self.verify_lectures = verify_lectures and lecture_jobs > 1
+        self.response_cache = ResponseCache() if cache else None
+        self.base_url = base_url
+        self.proxy = proxy
+        self.insecure = insecure
+        self.email = email
+        self.password = password
+        # Shared by every session and download, so limits apply to the
+        # whole crawl
+        self.throttle = Throttle(rate=rate,
+                                 max_concurrency=(jobs * lecture_jobs
+                                                  + download_jobs),
+                                 retries=retries,
+                                 timeout=timeout)
+        self.parse_pool = (ProcessPoolExecutor(parse_workers)
+                           if parse_workers else None)
+        self.profile = profile
+        self.profile_format = profile_format
+        self.favorites = favorites
+        self.newest_first = newest_first
+        # With 'jsonl', a record of every course, lecture and attachment is
+        # written to stdout as soon as it is found
+        self.records = (RecordStream(on_broken=self.cancel)
+                        if output_format == 'jsonl' else None)
+
+        self.metrics = Metrics()
+        if debug:
+            self.metrics.add_hook(_log_event)
+
+        # Only the primary session is saved; pool workers log in on their own
+        session_cache = SessionCache(session_path)
+        if fresh_login:
+            session_cache.clear()
+        self.api = self._new_api(session_cache)
+        self.primary = None
+        self.files = FileManager(root=root,
+                                 all=all,
+                                 downloader=Downloader(download_jobs,
+                                                       bandwidth))
+        self.fingerprints = Fingerprints(os.path.join(self.files.meta_dir,
+                                                      'fingerprints.json'))
+        # Opened by the first pull, so that other commands do not create it
+        self.index = None
+        self.plan = None
+        self._checkpoint_lock = threading.Lock()
+
+    def login(self):
+        """Login and return the primary Worker, or None if logging in
+        failed.
+
+        The session is kept, so later calls return the same worker.
+        """
+        if self.primary is not None:
+            return self.primary
 
-    def pull(self):
-        """Pull files from CourseNavi."""
         try:
             dashboard = self.api.login()
         except NoCredentialsError:
             print("[No credentials] Please set your CourseNavi email and "
                   + "password with `cnavi config`")
-            return
+            return None
         except InvalidCredentialsError:
             print("[Login error] There was an issue logging in. If you think "
                   + "this is an application error, please let me know at "
                   + "shoyoinokuchi@gmail.com. Otherwise, your can reset your "
                   + "credentials with `cnavi config`.")
+            return None
+
+        self.primary = Worker(self.api, dashboard)
+        return self.primary
+
+    def refresh(self):
+        """Reload the dashboard of the primary session so that it does not
+        time out, logging in again if it already has.
+        """
+        if self.primary is None:
+            self.login()
+            return
+        dashboard = self.api.refresh(self.primary.dashboard)
+        self.primary = Worker(self.api, dashboard)
+
+    def pull(self):
+        """Pull files from CourseNavi.
+
+        Courses are crawled concurrently by `self.jobs` independently
+        logged-in sessions, favorite courses first. Progress is checkpointed
+        to a CrawlPlan, so a pull that was interrupted or cancelled is
+        resumed by the next one.
+
+        Each pull starts from the manifest and fingerprints on disk, and
+        records its own metrics, so that a long-lived TaskManager (see
+        `daemon.Daemon`) can pull repeatedly.
+        """
+        self.metrics.reset()
+        self.files.reload()
+        self.fingerprints.reload()
+        primary = self.login()
+        if primary is None:
+            return
+
+        if self.index is None:
+            self.index = Index(index_path(self.files.root))
+        self.plan = CrawlPlan(os.path.join(self.files.meta_dir, 'plan.json'),
+                              all=self.files.all)
+        if self.plan.resumed:
+            print('> Resuming the interrupted pull')
+
+        dashboard = self.plan.task('dashboard', 'dashboard', 'Dashboard')
+        tasks = {}
+        for index, course in enumerate(primary.courses):
+            self._emit({
+                'type': 'course',
+                'id': course.ad_hoc_fields['hidCommunityId'],
+                'folder_id': course.fields['folder_id[]'],
+                'title': course.title,
+                'position': index,
+            })
+            task = self.plan.task('course',
+                                  course.ad_hoc_fields['hidCommunityId'],
+                                  course.title,
+                                  priority=(not self._is_favorite(course),
+                                            index))
+            tasks[task] = (index, course.title)
+        if self.verbose:
+            for task in tasks:
+                if task.done:
+                    print(f'> Course title: {task.title}\n'
+                          + ' > Pulled before the interruption')
+
+        pool = SessionPool(self._new_api, self.jobs, primary=primary)
+        courses = [(task, *tasks[task]) for task in self.plan.pending(tasks)]
+
+        try:
+            for lines in pool.map(self._pull_course, courses,
+                                  cancel=self.plan.cancel):
+                print('\n'.join(lines))
+            if all(task.done for task in tasks):
+                self.plan.finish(dashboard)
+                # Every course was pulled, so the index can lose the others
+                self.index.prune_courses(
+                    course.ad_hoc_fields['hidCommunityId']
+                    for course in primary.courses)
+        finally:
+            pool.close()
+            self._checkpoint(force=True)
+            self._report()
+
+        if dashboard.done:
+            self.plan.complete()
+        self.api.save_session()
+
+    def cancel(self):
+        """Stop the running pull once the requests in flight returned.
+
+        What was pulled so far is checkpointed, and the next pull resumes
+        from there.
+        """
+        if self.plan is not None:
+            self.plan.cancel()
+
+    def list_courses(self):
+        """Print the titles of the courses on the dashboard."""
+        primary = self.login()
+        if primary is None:
             return
+        for course in primary.courses:
+            print(course.title)
+
+    def close(self):
+        """Wait for running downloads and release the worker pools.
 
-        courses = self.api.get_courses(dashboard)
+        Downloads that have not started yet are dropped if the pull was
+        cancelled; the next pull resumes them.
+        """
+        self.files.downloader.shutdown(
+            cancel=self.plan is not None and self.plan.cancelled)
+        if self.records is not None:
+            self.records.close()
+        if self.index is not None:
+            self.index.close()
+        self.api.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
 
-        for title, course in courses:
-            print(f'> Course title: {title}')
+    def _report(self):
+        """Print and save the request metrics of the run as configured."""
+        if self.verbose:
+            print(self.metrics.format_table())
+        if self.profile:
+            with open(self.profile, 'w') as f:
+                if self.profile_format == 'folded':
+                    f.write(self.metrics.to_folded())
+                else:
+                    f.write(self.metrics.to_json())
 
-            course_detail = self.api.select_course(course, dashboard)
-            lectures = self.api.get_lectures(course_detail)
+    def _pull_course(self, worker, course):
+        """Pull a single course with a worker and return its status logs.
 
-            print(f' > Found {len(lectures)} lectures')
+        Unless every file is pulled, a course whose lecture listing is
+        unchanged since it was last pulled completely is skipped, and so is
+        each unchanged lecture of a changed one. Lectures and attachments
+        already pulled by an interrupted run are skipped as well.
 
-            for title, lecture in lectures:
-                print(f'  > {title}')
+        course -- a tuple of: (<course Task>, <index on dashboard>, <title>)
+        """
+        task, position, title = course
+        lines = [f'> Course title: {title}']
+        if self.plan.cancelled:
+            lines.append(' > Cancelled')
+            return lines
 
-                lecture_detail = self.api.select_lecture(lecture,
-                                                         course_detail)
-#                print(lecture_detail.prettify())
+        course = worker.find_course(position, title)
+        course_detail = worker.api.select_course(course, worker.dashboard)
+        course_detail_form = course_detail.form
+        lectures = course_detail.lectures
 
+        lines.append(f' > Found {len(lectures)} lectures')
+
+        course_key = course.ad_hoc_fields['hidCommunityId']
+        listing = listing_fingerprint(lectures)
+        if (not self.files.all
+                and self.fingerprints.is_unchanged(course_key, listing)):
+            if self.verbose:
+                lines.append(' > Unchanged since the last pull')
+            self._emit_lectures(course, lectures, ())
+            self.index.update_course(position, course, lectures, {})
+            self.plan.finish(task)
+            return lines
+
+        changed = [lecture for lecture in lectures
+                   if self.files.all
+                   or not self.fingerprints.has_lecture(course_key,
+                                                        lecture.fingerprint)]
+        self._emit_lectures(course, lectures, changed)
+        if self.verbose:
+            lines.extend(f'  > {lecture.title} (unchanged)'
+                         for lecture in lectures if lecture not in changed)
+
+        lecture_tasks = {}
+        for index, lecture in enumerate(changed):
+            lecture_task = self.plan.task(
+                'lecture', f'{course_key}/{lecture.fingerprint}',
+                lecture.title,
+                priority=-index if self.newest_first else index)
+            lecture_tasks[lecture_task] = lecture
+        if self.verbose:
+            lines.extend(f'  > {lecture_task.title} (pulled before the '
+                         + 'interruption)'
+                         for lecture_task in lecture_tasks
+                         if lecture_task.done)
+        pending = [(lecture_task, lecture_tasks[lecture_task])
+                   for lecture_task in self.plan.pending(lecture_tasks)]
+
+        lecture_lines = []
+        downloads = []
+        attachments = {}
+        lecture_errors = 0
+        # Lectures are fetched a few at a time, so that a cancelled pull
+        # stops soon and progress is checkpointed as it goes
+        batch_size = self.lecture_jobs * LECTURE_BATCH
+        for start in range(0, len(pending), batch_size):
+            if self.plan.cancelled:
                 break
-            break
+            batch = pending[start:start + batch_size]
+            lecture_details = self._select_lectures(
+                worker, [lecture for _, lecture in batch], course_detail_form)
+
+            for (lecture_task, lecture), lecture_detail in zip(
+                    batch, lecture_details):
+                lecture_lines.append([f'  > {lecture.title}'])
+                if isinstance(lecture_detail, Exception):
+                    # Its task stays unfinished, so the next pull retries it
+                    lecture_errors += 1
+                    lecture_lines[-1].append(
+                        f'   > [Lecture error] {lecture_detail!r}')
+                    continue
+                files = attachments[lecture.ad_hoc_fields['hidAdmKey02']] = []
+                for name, url in worker.api.get_attachments(lecture_detail):
+                    files.append((name, url,
+                                  self.files.key(name, title, lecture.title)))
+                for name, url, path in files:
+                    self._emit({
+                        'type': 'attachment',
+                        'course_id': course.ad_hoc_fields['hidCommunityId'],
+                        'lecture_id': lecture.ad_hoc_fields['hidAdmKey02'],
+                        'name': name,
+                        'url': url,
+                        'path': os.path.join(self.files.root, path),
+                    })
+                # All of them, before any download can finish
+                file_tasks = [self.plan.task('attachment',
+                                             f'{lecture_task.id}/{url}', name)
+                              for name, url, _ in files]
+                for (name, url, _), file_task in zip(files, file_tasks):
+                    if file_task.done:
+                        continue
+                    future = self.files.submit(worker.api.fetch_attachment,
+                                               url, name, title,
+                                               lecture.title)
+                    future.add_done_callback(functools.partial(
+                        self._attachment_synced, file_task, lecture_task,
+                        file_tasks))
+                    downloads.append((lecture_lines[-1], name, future))
+                if all(file_task.done for file_task in file_tasks):
+                    self.plan.finish(lecture_task)
+
+            self._checkpoint()
+
+        # Also when no lecture was pending, e.g. one was only removed
+        self.index.update_course(position, course, lectures, attachments)
+
+        failed = 0
+        for log, name, future in downloads:
+            if self.plan.cancelled:
+                # Unless it started already; the next pull resumes it
+                future.cancel()
+            try:
+                downloaded = future.result()
+            except CancelledError:
+                continue
+            except Exception as e:
+                # Its tasks stay unfinished, so the next pull retries it
+                failed += 1
+                log.append(f'   > [Download error] {name}: {e!r}')
+                continue
+            if downloaded:
+                log.append(f'   > Downloaded {name}')
+            elif self.verbose:
+                log.append(f'   > Up to date {name}')
+
+        for log in lecture_lines:
+            lines.extend(log)
+
+        if self.plan.cancelled:
+            lines.append(' > Cancelled')
+            return lines
+        if lecture_errors:
+            lines.append(f' > {lecture_errors} lectures failed to load and '
+                         + 'will be retried by the next pull')
+        if failed:
+            lines.append(f' > {failed} files failed to download and will be '
+                         + 'retried by the next pull')
+        if lecture_errors or failed:
+            self._checkpoint()
+            return lines
+
+        # Only now that every attachment is synced
+        self.fingerprints.update(course_key, listing,
+                                 [lecture.fingerprint for lecture in lectures])
+        self.plan.finish(task)
+        self._checkpoint()
+
+        return lines
+
+    def _select_lectures(self, worker, lectures, course_detail):
+        """Select a batch of lectures and return their lecture details.
+
+        A lecture the server failed to serve even after retries is returned
+        as the exception raised instead, so that the rest of the batch is
+        still pulled.
+        """
+        try:
+            return worker.api.select_lectures(lectures, course_detail,
+                                              max_workers=self.lecture_jobs,
+                                              verify=self.verify_lectures)
+        except requests.RequestException:
+            pass
+
+        # Find out which lectures failed
+        lecture_details = []
+        for lecture in lectures:
+            try:
+                lecture_details.append(
+                    worker.api.select_lecture(lecture, course_detail))
+            except requests.RequestException as e:
+                lecture_details.append(e)
+        return lecture_details
+
+    def _emit(self, record):
+        """Write a record if records are streamed."""
+        if self.records is not None:
+            self.records.emit(record)
+
+    def _emit_lectures(self, course, lectures, changed):
+        """Write a record of each lecture of a course.
+
+        changed -- the lectures that are visited, as they changed
+        """
+        for lecture in lectures:
+            self._emit({
+                'type': 'lecture',
+                'course_id': course.ad_hoc_fields['hidCommunityId'],
+                'id': lecture.ad_hoc_fields['hidAdmKey02'],
+                'title': lecture.title,
+                'fingerprint': lecture.fingerprint,
+                'changed': lecture in changed,
+            })
+
+    def _attachment_synced(self, file_task, lecture_task, file_tasks,
+                           future):
+        """Mark an attachment as done once its download succeeded, and its
+        lecture once all of the lecture's attachments are.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.plan.finish(file_task)
+        if all(task.done for task in file_tasks):
+            self.plan.finish(lecture_task)
+
+    def _checkpoint(self, force=False):
+        """Save the manifest, fingerprints and plan if it is time to.
+
+        They are saved together so that whatever the plan records as done
+        is also in the manifest.
+        """
+        if self.plan is None or not (force or self.plan.due()):
+            return
+        with self._checkpoint_lock:
+            self.files.save()
+            self.fingerprints.save()
+            self.plan.save()
+
+    def _is_favorite(self, course):
+        """Return True if a course's title contains one of `favorites`."""
+        return any(favorite in course.title for favorite in self.favorites)
+
+    def _new_api(self, session_cache=None):
+        return CourseNaviInterface(parser=self.parser,
+                                   restrict=True,
+                                   stream=self.stream,
+                                   session_cache=session_cache,
+                                   response_cache=self.response_cache,
+                                   base_url=self.base_url,
+                                   proxy=self.proxy,
+                                   metrics=self.metrics,
+                                   throttle=self.throttle,
+                                   parse_pool=self.parse_pool,
+                                   email=self.email,
+                                   password=self.password,
+                                   insecure=self.insecure)
+
 
+def _log_event(step, phase, seconds, size):
+    """Print a metrics event for debugging."""
+    line = f'[{step}] {phase} {seconds * 1000:.1f} ms'
+    if size:
+        line += f', {size / 1024:.1f} KiB'
+    print(line)
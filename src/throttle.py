@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+
+import requests
+
+from downloader import BandwidthLimiter
+
+
+# Responses worth retrying: the server is overloaded or failed transiently
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Steps whose request can safely be sent again after the server received
+# it: repeating them serves the same page. Any other step (i.e. 'login',
+# which starts a new server-side session) is only retried if it never
+# reached the server.
+IDEMPOTENT_STEPS = frozenset([
+    'login_page',
+    'login_redirect',
+    'resume_session',
+    'course_detail',
+    'course_detail_redirect',
+    'lecture_detail',
+    'attachment',
+])
+
+
+class ConcurrencyController:
+    """AIMD limit on the number of requests in flight.
+
+    Every healthy response raises the limit by 1 / limit, i.e. by about one
+    per round of requests, up to `maximum`. A failed or slow response halves
+    it, down to `minimum`.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=2, slow=5.0):
+        """maximum -- largest number of requests in flight
+        minimum -- smallest number of requests in flight
+        initial -- number of requests in flight to start with
+        slow    -- seconds after which a response counts as unhealthy
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.slow = slow
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until another request may be sent."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, seconds, ok):
+        """Finish a request and adapt the limit to how it went.
+
+        seconds -- time the request took
+        ok      -- False if the request failed
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if ok and seconds <= self.slow:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit / 2)
+            self._condition.notify_all()
+
+
+class Throttle:
+    """Rate limit, concurrency limit, timeout and retries of page requests.
+
+    One throttle is meant to be shared by every interface crawling an
+    account, so that their combined traffic stays within the limits.
+    """
+
+    def __init__(self, rate=None, max_concurrency=4, retries=3, timeout=30,
+                 backoff=0.5, max_backoff=30):
+        """rate            -- requests per second across all sessions, or
+                           None for no limit
+        max_concurrency -- largest number of requests in flight
+        retries         -- attempts after the first for a failed request
+        timeout         -- seconds to wait for the server to connect or
+                           send data
+        backoff         -- base delay of the exponential backoff in seconds
+        max_backoff     -- longest delay between attempts in seconds
+        """
+        self.limiter = BandwidthLimiter(rate) if rate else None
+        self.controller = ConcurrencyController(max_concurrency,
+                                                slow=timeout / 2)
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def send(self, step, send):
+        """Send a request and return its response, retrying on failure.
+
+        A response with one of `RETRY_STATUSES` is retried if the step is
+        idempotent and returned as is once attempts run out; timeouts and
+        connection errors are re-raised once attempts run out.
+
+        step -- navigation step name of the request
+        send -- callable taking a timeout and sending the request
+        """
+        idempotent = step in IDEMPOTENT_STEPS
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            if self.limiter is not None:
+                self.limiter.consume(1)
+
+            self.controller.acquire()
+            start = time.monotonic()
+            try:
+                response = send(self.timeout)
+            except requests.ConnectTimeout:
+                self.controller.release(time.monotonic() - start, False)
+                if last:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                self.controller.release(time.monotonic() - start, False)
+                if last or not idempotent:
+                    raise
+            else:
+                ok = response.status_code not in RETRY_STATUSES
+                self.controller.release(time.monotonic() - start, ok)
+                if ok or last or not idempotent:
+                    return response
+                response.close()
+
+            time.sleep(self._delay(attempt))
+
+    def _delay(self, attempt):
+        """Return a random delay before the attempt after `attempt`.
+
+        Full jitter: uniform between 0 and the exponential backoff, so that
+        sessions failing together do not retry in lockstep.
+        """
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))